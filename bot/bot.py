@@ -1,21 +1,56 @@
 ﻿# Page Craft Bot - Memory Optimized for Render Free Tier
 import os
-import tempfile
+import sys
+import time
 import logging
-import shutil
 import gc
-try:
-    import psutil
-    PSUTIL_AVAILABLE = True
-except ImportError:
-    PSUTIL_AVAILABLE = False
-    print("Note: psutil not available - memory monitoring disabled for local testing")
+import re
+import asyncio
+import importlib.util
+import weakref
+from collections import OrderedDict, namedtuple
+from itertools import islice
+from dataclasses import dataclass, field
+from typing import Optional
 
 from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.error import Conflict, TimedOut
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, ConversationHandler
+
+def lazy_import(name):
+    """Import a module whose body only runs on first attribute access
+    
+    Keeps cold-start time and RSS down for modules that most updates never
+    touch. Raises ImportError straight away if the module is not installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# Memory optimization: heavy or rarely used modules load on first use
+shutil = lazy_import("shutil")
+tempfile = lazy_import("tempfile")
+aiohttp = lazy_import("aiohttp")
 
 # Configure minimal logging to reduce memory overhead
 logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s')
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)  # Startup and warning messages stay visible under the ERROR root level
+
+try:
+    psutil = lazy_import("psutil")
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+    log.info("Note: psutil not available - memory monitoring disabled for local testing")
 
 # Memory optimization: Import utils only when needed (lazy loading)
 # from utils.pdf_utils import merge_pdfs, split_pdf, pdf_to_images, create_zip_from_images, word_to_pdf
@@ -23,198 +58,492 @@ logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s')
 # Conversation states
 WAITING_FOR_FILENAME = 1
 
-# Store user files temporarily (with strict memory limits)
-user_files = {}
-pending_files = {}
+# Anything other than letters, digits, spaces, hyphens and underscores is dropped from filenames
+_FILENAME_STRIP = re.compile(r'[^\w\- ]')
+
+# Extension appended to the user's chosen name for each result type
+_EXT_MAP = {'pdf': '.pdf', 'zip': '.zip'}
+
+# Upload routing is decided from the MIME type alone
+_PDF_MIME = 'application/pdf'
+_IMAGE_MIME_PREFIX = 'image/'
+
+@dataclass(slots=True)
+class FileEntry:
+    """A stored upload or processed result; message_id is set for files that can be replied to"""
+    name: str
+    path: str
+    kind: str = 'pdf'
+    message_id: Optional[int] = None
+    size: int = 0
+
+@dataclass(slots=True)
+class UserFiles:
+    """A user's files in upload order, split by kind and indexed by message id"""
+    entries: list = field(default_factory=list)
+    pdfs: list = field(default_factory=list)
+    images: list = field(default_factory=list)
+    by_message_id: dict = field(default_factory=dict)
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def add(self, entry):
+        """Store an entry and keep the per-kind lists and reply index in sync"""
+        self.entries.append(entry)
+        if entry.kind == 'image':
+            self.images.append(entry)
+        else:
+            self.pdfs.append(entry)
+        if entry.message_id is not None:
+            self.by_message_id[entry.message_id] = entry
+
+@dataclass(slots=True)
+class PendingFile:
+    """A processed result waiting for the user to name it; kept in context.user_data['pending']"""
+    file_path: str
+    file_type: str
+    operation_info: str
+    message_to_reply: object
+    ext: str = ''
+
+# Store user files temporarily (with strict memory limits): user_id -> UserFiles, least recently stored first
+user_files = OrderedDict()
 
 # Memory optimization: Reduce limits for free tier
 MAX_FILES_PER_USER = 5  # Reduced from 20
 MAX_FILE_SIZE_MB = 10   # Limit individual file size
 MAX_TOTAL_MEMORY_MB = 200  # Total memory limit
+_MEM_LIMIT_BYTES = MAX_TOTAL_MEMORY_MB * 1024 * 1024
+MAX_ACTIVE_USERS = 500  # Users whose files are kept; the least recently active are dropped first
+MAX_CONCURRENT_JOBS = 2  # PDF/image operations processed in parallel
+STATUS_DELAY = 2.0  # Seconds before a progress message is worth sending
 
 # Enhanced auto-wake system for Render
 RENDER_URL = os.getenv('RENDER_EXTERNAL_URL', None)
 AUTO_WAKE_ENABLED = True
+WAKE_INTERVAL = 600  # Seconds; stays under Render's 15-minute idle timeout
+WAKE_THROTTLE = 60  # Minimum seconds between activity-triggered pings
 WAKE_URLS = [
     "https://page-craft-bot.onrender.com",
     "https://page-craft-bot.onrender.com/health",
     "https://page-craft-bot.onrender.com/"
 ]
+WAKE_HEADERS = {
+    'User-Agent': 'PageCraftBot-KeepAlive/1.0',
+    'Accept': 'text/html,application/json'
+}
 
-def get_memory_usage():
-    """Get current memory usage in MB"""
+# Shared keep-alive session, last activity ping and references to fire-and-forget tasks
+_wake_session = None
+_last_wake = 0.0
+_background_tasks = set()
+
+# Last RSS sample as (monotonic timestamp, bytes) and the reusable process handle
+_mem_cache = (0.0, 0)
+_mem_proc = None
+
+def _rss_bytes():
+    """Resident set size in bytes, sampled at most once per second (0 without psutil)"""
+    global _mem_cache, _mem_proc
+    now = time.monotonic()
+    if now - _mem_cache[0] < 1.0:
+        return _mem_cache[1]
     try:
         if PSUTIL_AVAILABLE:
-            process = psutil.Process(os.getpid())
-            return process.memory_info().rss / 1024 / 1024
+            if _mem_proc is None:
+                _mem_proc = psutil.Process(os.getpid())
+            rss = _mem_proc.memory_info().rss
         else:
-            return 0  # No monitoring available locally
+            rss = 0  # No monitoring available locally
     except:
-        return 0
+        rss = 0
+    _mem_cache = (now, rss)
+    return rss
+
+def get_memory_usage():
+    """Get current memory usage in MB"""
+    return _rss_bytes() / 1048576
 
 def cleanup_memory():
-    """Force garbage collection and memory cleanup"""
-    gc.collect()
+    """Collect young garbage; long-lived startup objects are frozen out of GC"""
+    gc.collect(1)
     
 def check_memory_limit():
     """Check if we're approaching memory limits"""
-    memory_mb = get_memory_usage()
-    if memory_mb > MAX_TOTAL_MEMORY_MB and memory_mb > 0:
-        logging.warning(f"High memory usage: {memory_mb:.1f}MB")
+    rss = _rss_bytes()
+    if rss > _MEM_LIMIT_BYTES:
+        log.warning("High memory usage: %.1fMB", rss / 1048576)
         cleanup_memory()
         return False
     return True
 
+# PDF utility functions by name; every field is None when the import fails
+PdfUtils = namedtuple('PdfUtils', 'merge_pdfs split_pdf pdf_to_images pdf_to_images_zip create_zip_from_images image_to_pdf images_to_pdf')
+_PDF_UTILS_MISSING = PdfUtils(None, None, None, None, None, None, None)
+
+# Resolved PDF utility functions, filled on the first successful import
+_pdf_utils_cache = None
+
 def lazy_import_pdf_utils():
     """Import PDF utilities with proper error handling"""
+    global _pdf_utils_cache
+    if _pdf_utils_cache is not None:
+        return _pdf_utils_cache
     try:
-        from utils.pdf_utils import merge_pdfs, split_pdf, pdf_to_images, create_zip_from_images, image_to_pdf
-        return merge_pdfs, split_pdf, pdf_to_images, create_zip_from_images, image_to_pdf
+        from utils.pdf_utils import merge_pdfs, split_pdf, pdf_to_images, pdf_to_images_zip, create_zip_from_images, image_to_pdf, images_to_pdf
+        _pdf_utils_cache = PdfUtils(merge_pdfs, split_pdf, pdf_to_images, pdf_to_images_zip, create_zip_from_images, image_to_pdf, images_to_pdf)
+        return _pdf_utils_cache
     except ImportError as e:
-        logging.error(f"Failed to import PDF utilities: {e}")
-        return None, None, None, None, None
+        log.error("Failed to import PDF utilities: %s", e)
+        return _PDF_UTILS_MISSING
     except Exception as e:
-        logging.error(f"Unexpected error loading PDF utilities: {e}")
-        return None, None, None, None, None
+        log.error("Unexpected error loading PDF utilities: %s", e)
+        return _PDF_UTILS_MISSING
+
+def warm_pdf_backend():
+    """Import pypdf ahead of the first /merge or /split; image backends stay lazy"""
+    if lazy_import_pdf_utils() is _PDF_UTILS_MISSING:
+        return
+    try:
+        importlib.import_module("pypdf")
+    except ImportError as e:
+        log.error("Failed to pre-load pypdf: %s", e)
+
+# Heavy PDF/image jobs run in worker threads; cap how many run at once
+_pdf_job_slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+
+async def run_pdf_job(func, *args):
+    """Run a blocking PDF utility off the event loop, bounded by MAX_CONCURRENT_JOBS"""
+    async with _pdf_job_slots:
+        return await asyncio.to_thread(func, *args)
+
+# One lock per user, alive only while that user has an update in flight
+_user_locks = weakref.WeakValueDictionary()
+
+def _lock_for(user_id):
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    return lock
+
+class PageCraftApplication(Application):
+    """Application that handles different users' updates concurrently but each user's in order
+    
+    A user's stored files and pending result must see that user's updates one
+    at a time, so serializing per user keeps that guarantee while
+    concurrent_updates lets one user's slow job stop blocking everyone else.
+    """
+    
+    async def process_update(self, update):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            return await super().process_update(update)
+        async with _lock_for(user.id):
+            return await super().process_update(update)
+
+class StatusReporter:
+    """Progress message that is only sent if an operation outlasts STATUS_DELAY
+    
+    Fast operations finish without any extra Bot API round trips; slow ones
+    get the usual "working..." message, edited to the final text when done.
+    """
+    
+    def __init__(self, message, text, delay=None):
+        self._reply_to = message
+        self._text = text
+        self._delay = STATUS_DELAY if delay is None else delay
+        self._message = None
+        self._sending = False
+        self._task = None
+    
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._show_later())
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._settle()
+    
+    async def _show_later(self):
+        await asyncio.sleep(self._delay)
+        self._sending = True
+        self._message = await self._reply_to.reply_text(self._text)
+    
+    async def _settle(self):
+        # Cancel a message that hasn't gone out yet; let an in-flight one land
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if not self._sending:
+            task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    
+    async def done(self, text):
+        """Edit the progress message to its final text, if it was ever shown"""
+        await self._settle()
+        if self._message is not None:
+            await self._message.edit_text(text)
+
+def _write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# One scratch directory per user holds every stored upload and result
+_user_tmpdirs = {}
+
+def _user_dir(user_id):
+    """Return the user's scratch directory, creating it on first use"""
+    path = _user_tmpdirs.get(user_id)
+    if path is None or not os.path.isdir(path):
+        path = _user_tmpdirs[user_id] = tempfile.mkdtemp(prefix=f"pc_{user_id}_")
+    return path
+
+def _new_workdir(user_id):
+    """Fresh scratch directory for one operation, inside the user's directory"""
+    return tempfile.mkdtemp(prefix="op_", dir=_user_dir(user_id))
+
+def _discard_workdir(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+def _holds_pending(context, path):
+    """True if the user's unsent result lives in the workdir at path"""
+    pending = context.user_data.get('pending')
+    return pending is not None and os.path.dirname(pending.file_path) == path
+
+def _user_busy(user_id):
+    """True while one of the user's updates holds their lock, e.g. during a PDF job"""
+    lock = _user_locks.get(user_id)
+    return lock is not None and lock.locked()
+
+def _touch_user(user_id):
+    """Mark a user with stored files as most recently used"""
+    if user_id in user_files:
+        user_files.move_to_end(user_id)
+
+async def _files_for(user_id, context):
+    """Return a user's UserFiles as most recently used, evicting the oldest users past MAX_ACTIVE_USERS"""
+    files = user_files.get(user_id)
+    if files is None:
+        files = user_files[user_id] = UserFiles()
+    else:
+        user_files.move_to_end(user_id)
+    
+    # Evict the least recently used users, skipping any with an update in flight
+    excess = len(user_files) - MAX_ACTIVE_USERS
+    if excess <= 0:
+        return files
+    stale = list(islice((old_id for old_id in user_files if old_id != user_id and not _user_busy(old_id)), excess))
+    old_dirs = []
+    for old_id in stale:
+        del user_files[old_id]
+        context.application.drop_user_data(old_id)
+        old_dir = _user_tmpdirs.pop(old_id, None)
+        if old_dir:
+            old_dirs.append(old_dir)
+    for old_dir in old_dirs:
+        await asyncio.to_thread(_discard_workdir, old_dir)
+    return files
+
+async def remove_files(paths):
+    """Delete files concurrently in worker threads, ignoring ones already gone"""
+    await asyncio.gather(*(asyncio.to_thread(_remove_quietly, path) for path in paths))
+
+async def download_to_path(file, path):
+    """Download a Telegram file without blocking the event loop on disk writes"""
+    data = await file.download_as_bytearray()
+    await asyncio.to_thread(_write_bytes, path, data)
+
+def _move_file(src, dst):
+    """Give a file a new path without copying its bytes"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        # Renames fail across mounts; fall back to a copying move
+        shutil.move(src, dst)
+
+async def _get_wake_session():
+    """Return the shared keep-alive HTTP session, creating it on first use"""
+    global _wake_session
+    if _wake_session is None or _wake_session.closed:
+        _wake_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=120),
+            timeout=aiohttp.ClientTimeout(total=5),
+            headers=WAKE_HEADERS
+        )
+    return _wake_session
+
+async def close_wake_session(application=None):
+    """Close the keep-alive HTTP session (usable as a post_shutdown hook)"""
+    global _wake_session
+    if _wake_session is not None and not _wake_session.closed:
+        await _wake_session.close()
+    _wake_session = None
+
+async def _ping(session, url):
+    """GET a single URL and return its HTTP status"""
+    async with session.get(url) as response:
+        return response.status
+
+async def _wake_all():
+    """Ping every wake URL concurrently; returns True if any answered 200"""
+    session = await _get_wake_session()
+    urls = list(WAKE_URLS)
+    if RENDER_URL:
+        urls.append(f"{RENDER_URL}/")
+    
+    results = await asyncio.gather(*(_ping(session, url) for url in urls), return_exceptions=True)
+    
+    woke = False
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            log.warning("⚠️ Wake attempt failed for %s: %s", url, result)
+        elif result == 200:
+            woke = True
+    return woke
+
+def _spawn(coro):
+    """Run a coroutine in the background, keeping a reference until it finishes"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
 async def wake_service_on_activity():
-    """Enhanced auto-wake system with multiple strategies"""
+    """Enhanced auto-wake system - pings run in the background on the bot's event loop"""
+    global _last_wake
     if not AUTO_WAKE_ENABLED:
         return
-        
-    import threading
     
-    def wake_service():
-        """Background wake-up function"""
-        try:
-            import urllib.request
-            import time
-            
-            # Strategy 1: Immediate wake-up on user activity
-            for url in WAKE_URLS:
-                try:
-                    response = urllib.request.urlopen(url, timeout=5)
-                    if response.getcode() == 200:
-                        print(f"🚀 Service woke up successfully via {url}")
-                        break
-                except Exception as e:
-                    print(f"⚠️ Wake attempt failed for {url}: {e}")
-                    continue
-                    
-            # Strategy 2: Keep-alive ping
-            if RENDER_URL:
-                try:
-                    urllib.request.urlopen(f"{RENDER_URL}/", timeout=3)
-                except:
-                    pass
-                    
-        except Exception as e:
-            print(f"⚠️ Wake service error: {e}")
+    # A burst of commands only needs one ping to keep Render awake
+    now = time.monotonic()
+    if now - _last_wake < WAKE_THROTTLE:
+        return
+    _last_wake = now
     
-    # Run wake-up in background thread to not block user interaction
     try:
-        wake_thread = threading.Thread(target=wake_service, daemon=True)
-        wake_thread.start()
+        _spawn(_wake_all())
+    except Exception as e:
+        log.warning("⚠️ Failed to schedule wake-up: %s", e)
+
+async def _wake_job(context=None):
+    """Ping the wake URLs once; runs as a repeating JobQueue callback"""
+    try:
+        if await _wake_all():
+            log.info("✅ Auto-wake successful")
+        else:
+            log.warning("❌ All wake URLs failed - service may be sleeping")
+            log.warning("💡 TIP: Use external monitoring service like UptimeRobot!")
     except Exception as e:
-        print(f"⚠️ Failed to start wake thread: {e}")
+        log.warning("⚠️ Auto-wake error: %s", e)
+
+async def _periodic_wake():
+    """Fallback keep-alive loop for when the JobQueue extra is not installed"""
+    while True:
+        await asyncio.sleep(WAKE_INTERVAL)
+        await _wake_job()
 
-def start_auto_wake_service():
-    """Start background auto-wake service to prevent sleeping"""
+async def start_auto_wake_service(application=None):
+    """Start background auto-wake service to prevent sleeping
+    
+    Usable as an Application post_init hook. Pings are scheduled on the
+    application's JobQueue so they share the bot's own event loop.
+    """
     if not AUTO_WAKE_ENABLED:
         return
-        
-    import threading
-    import time
     
-    def periodic_wake():
-        """Keep service awake with aggressive pings to prevent 15-min timeout"""
-        while True:
-            try:
-                # CRITICAL: Wait 10 minutes (under 15-min Render timeout)
-                # Render free tier sleeps after 15 min of no HTTP activity
-                time.sleep(600)  # 10 minutes = 600 seconds
-                
-                # Ping multiple endpoints aggressively
-                import urllib.request
-                import socket
-                
-                # Set socket timeout globally
-                socket.setdefaulttimeout(15)
-                
-                wake_success = False
-                for url in WAKE_URLS:
-                    try:
-                        print(f"🔄 Auto-wake ping to: {url}")
-                        
-                        # Create request with headers to look like real traffic
-                        req = urllib.request.Request(
-                            url,
-                            headers={
-                                'User-Agent': 'PageCraftBot-KeepAlive/1.0',
-                                'Accept': 'text/html,application/json'
-                            }
-                        )
-                        
-                        response = urllib.request.urlopen(req, timeout=15)
-                        if response.getcode() == 200:
-                            print(f"✅ Auto-wake successful via {url}")
-                            wake_success = True
-                            break
-                    except Exception as url_error:
-                        print(f"⚠️ Wake ping failed for {url}: {url_error}")
-                        continue
-                
-                if not wake_success:
-                    print("❌ All wake URLs failed - service may be sleeping")
-                    print("💡 TIP: Use external monitoring service like UptimeRobot!")
-                        
-            except Exception as e:
-                print(f"⚠️ Auto-wake error: {e}")
-    
-    # Start the auto-wake thread
     try:
-        wake_thread = threading.Thread(target=periodic_wake, daemon=True)
-        wake_thread.start()
-        print("🚀 Auto-wake service started (10-minute intervals)")
-        print("⚠️ NOTE: Internal pings may not prevent sleeping on Render free tier")
-        print("💡 RECOMMENDED: Use UptimeRobot.com for external monitoring")
+        job_queue = getattr(application, 'job_queue', None)
+        if job_queue is not None:
+            job_queue.run_repeating(_wake_job, interval=WAKE_INTERVAL, first=WAKE_INTERVAL, name="auto_wake")
+        else:
+            _spawn(_periodic_wake())
+        log.info("🚀 Auto-wake service started (10-minute intervals)")
+        log.info("⚠️ NOTE: Internal pings may not prevent sleeping on Render free tier")
+        log.info("💡 RECOMMENDED: Use UptimeRobot.com for external monitoring")
     except Exception as e:
-        print(f"⚠️ Failed to start auto-wake: {e}")
+        log.warning("⚠️ Failed to start auto-wake: %s", e)
 
-def emergency_wake():
-    """Emergency wake-up for critical bot operations"""
-    try:
-        import urllib.request
-        
-        # Try to wake the service immediately
-        for url in WAKE_URLS:
-            try:
-                response = urllib.request.urlopen(url, timeout=10)
-                if response.getcode() == 200:
-                    print(f"🆘 Emergency wake successful via {url}")
-                    return True
-            except:
-                continue
-        return False
-    except:
-        return False
+# Polling mode still needs something answering on $PORT for Render health checks and wake pings
+HEALTH_PORT = os.getenv('PORT')
+_HEALTH_BODY = b'{"status": "running", "bot_name": "Page Craft Bot", "mode": "polling"}'
+_health_runner = None
+
+async def start_health_server(application=None):
+    """Serve / and /health on HEALTH_PORT from the bot's own event loop (usable as a post_init hook)"""
+    global _health_runner
+    if not HEALTH_PORT:
+        return
+    from aiohttp import web
+    
+    async def health(request):
+        return web.Response(body=_HEALTH_BODY, content_type='application/json')
+    
+    web_app = web.Application()
+    web_app.router.add_get('/', health)
+    web_app.router.add_get('/health', health)
+    _health_runner = web.AppRunner(web_app, access_log=None)
+    await _health_runner.setup()
+    await web.TCPSite(_health_runner, '0.0.0.0', int(HEALTH_PORT)).start()
+    log.info("🌐 Health check server listening on port %s", HEALTH_PORT)
+
+async def stop_health_server(application=None):
+    """Shut the health check server down (usable as a post_shutdown hook)"""
+    global _health_runner
+    if _health_runner is not None:
+        await _health_runner.cleanup()
+        _health_runner = None
+
+async def _on_startup(application):
+    await start_health_server(application)
+    await start_auto_wake_service(application)
+    # Import in the background so polling starts right away
+    _spawn(asyncio.to_thread(warm_pdf_backend))
+
+async def _on_shutdown(application):
+    await stop_health_server(application)
+    await close_wake_session(application)
 
 def find_replied_pdf(update: Update, user_id: int):
     """Find the PDF file that was replied to"""
     if not update.message.reply_to_message or not update.message.reply_to_message.document:
         return None
     
-    replied_message_id = update.message.reply_to_message.message_id
-    
-    if user_id not in user_files:
+    files = user_files.get(user_id)
+    if files is None:
         return None
     
-    # Quick lookup for performance
-    for file_info in user_files[user_id]:
-        if file_info.get('message_id') == replied_message_id:
-            return file_info
+    return files.by_message_id.get(update.message.reply_to_message.message_id)
+
+def _parse_file_numbers(arg, max_number):
+    """Parse a "1,3,2" selection in one pass
     
-    return None
+    Raises ValueError for tokens that are not numbers and IndexError(n) for
+    the first number outside 1..max_number.
+    """
+    numbers = []
+    for token in arg.split(','):
+        number = int(token)
+        if not 1 <= number <= max_number:
+            raise IndexError(number)
+        numbers.append(number)
+    return numbers
+
+def _format_file_list(files, exclude=None):
+    """Numbered "1. name" lines in upload order, skipping the excluded entry"""
+    return "".join(f"{i}. {f.name}\n" for i, f in enumerate(files, 1) if f is not exclude)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler"""
@@ -235,75 +564,76 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Files are auto-numbered as uploaded."
     )
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Help command handler"""
-    if not check_memory_limit():
-        await update.message.reply_text("⚠️ Service temporarily busy. Please try again.")
-        return
-        
-    await wake_service_on_activity()
-    
-    help_message = """
+# Static /help text, built once; sent as plain text so no Markdown markers
+_HELP_TEXT = """\
 📄 Page Craft Bot Commands:
 
-📤 **Upload Files** then use:
+📤 Upload Files then use:
 
-🔗 **Merge PDFs:**
+🔗 Merge PDFs:
 • /merge - Merge all uploaded PDFs
 • /merge 1,3,2 - Merge specific PDFs in order
 
-✂️ **Split PDF:**
+✂️ Split PDF:
 • /split 1 5-8 - Split PDF #1, pages 5 to 8  
 • /split 2 3 - Split PDF #2, page 3 only
 
-🖼️ **PDF to Images:**
+🖼️ PDF to Images:
 • /to_images - Convert latest PDF to images
 • /to_images 1 - Convert PDF #1 to images
 
-� **Image to PDF:**
+� Image to PDF:
 • Upload images → Stored for processing
 • /convert_image - Convert latest image to PDF
 • /convert_image 2 - Convert image #2 to PDF
 • /combine_images - Combine ALL images into 1 PDF
 
-💡 **Reply Feature:**
+💡 Reply Feature:
 Reply to any PDF message with commands:
 • Reply + /merge → Shows merge options
 • Reply + /split pages → Splits that PDF
 • Reply + /to_images → Converts that PDF
 
-📝 **Custom Filenames:**
+📝 Custom Filenames:
 After processing, you'll be asked to name your file!
 
-📋 **File Management:**
+📋 File Management:
 • /list - Show all uploaded files
 • /clear - Clear all uploaded files
 
-📁 **Supported Formats:**
+📁 Supported Formats:
 • PDF files (merge, split, convert to images)
 • Image files (JPG, PNG, GIF, BMP → convert/combine to PDF)
 
 📁 Files are numbered in upload order.
-    """
-    await update.message.reply_text(help_message)
+"""
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Help command handler"""
+    if not check_memory_limit():
+        await update.message.reply_text("⚠️ Service temporarily busy. Please try again.")
+        return
+        
+    await wake_service_on_activity()
+    
+    await update.message.reply_text(_HELP_TEXT)
 
 async def ask_for_filename(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str, file_type: str, operation_info: str):
     """Ask user for custom filename before sending processed file"""
-    user_id = update.effective_user.id
+    # A newer result replaces any unsent one; drop the old operation's scratch files
+    previous = context.user_data.get('pending')
+    if previous is not None:
+        await asyncio.to_thread(_discard_workdir, os.path.dirname(previous.file_path))
     
     # Store file info for later use
-    pending_files[user_id] = {
-        'file_path': file_path,
-        'file_type': file_type,
-        'operation_info': operation_info,
-        'message_to_reply': update.message
-    }
+    ext = _EXT_MAP.get(file_type, '')
+    context.user_data['pending'] = PendingFile(file_path, file_type, operation_info, update.message, ext)
     
     await update.message.reply_text(
         f"✅ {operation_info}\n\n"
         f"📝 **Please enter a filename for your {file_type}:**\n"
         f"(Just type the name, extension will be added automatically)\n\n"
-        f"Example: `my_document` → `my_document.{file_type.split('.')[-1]}`"
+        f"Example: `my_document` → `my_document{ext}`"
     )
     
     return WAITING_FOR_FILENAME
@@ -312,73 +642,64 @@ async def handle_filename_input(update: Update, context: ContextTypes.DEFAULT_TY
     """Handle the filename input from user"""
     user_id = update.effective_user.id
     
-    # Immediate acknowledgment
-    await update.message.reply_text("⚡ Processing...")
+    # Immediate acknowledgment, reused for every later status update
+    status_msg = await update.message.reply_text("⚡ Processing...")
     
-    if user_id not in pending_files:
-        await update.message.reply_text("❌ No pending file to rename. Please try the operation again.")
+    file_info = context.user_data.get('pending')
+    if file_info is None:
+        await status_msg.edit_text("❌ No pending file to rename. Please try the operation again.")
         return ConversationHandler.END
     
-    file_info = pending_files[user_id]
     filename = update.message.text.strip()
     
     # Sanitize filename
-    filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    filename = _FILENAME_STRIP.sub('', filename).rstrip()
     if not filename:
         filename = "document"
     
     # Add extension based on file type
-    if file_info['file_type'] == 'pdf':
-        final_filename = f"{filename}.pdf"
-    elif file_info['file_type'] == 'zip':
-        final_filename = f"{filename}.zip"
-    else:
-        final_filename = filename
+    final_filename = f"{filename}{file_info.ext}"
     
     # Send the file with custom name
     try:
         # Show processing status first
-        status_msg = await update.message.reply_text(f"📤 Sending {final_filename}...")
-        
-        with open(file_info['file_path'], 'rb') as f:
-            sent_message = await file_info['message_to_reply'].reply_document(
-                document=f,
-                filename=final_filename,
-                caption=f"📄 **{final_filename}**\n{file_info['operation_info']}",
-                read_timeout=30,
-                write_timeout=30,
-                connect_timeout=10
-            )
-        
-        # Store the sent file for future reply commands
-        if user_id not in user_files:
-            user_files[user_id] = []
+        await status_msg.edit_text(f"📤 Sending {final_filename}...")
+        
+        # Read off the event loop so other users' updates keep flowing
+        file_data = await asyncio.to_thread(_read_bytes, file_info.file_path)
+        sent_message = await file_info.message_to_reply.reply_document(
+            document=file_data,
+            filename=final_filename,
+            caption=f"📄 **{final_filename}**\n{file_info.operation_info}",
+            read_timeout=30,
+            write_timeout=30,
+            connect_timeout=10
+        )
+        del file_data
         
-        # Create a copy of the file for reply functionality
-        temp_dir = tempfile.mkdtemp()
-        new_file_path = os.path.join(temp_dir, final_filename)
+        # Keep the file for reply functionality
+        temp_dir = await asyncio.to_thread(_user_dir, user_id)
+        new_file_path = os.path.join(temp_dir, f"{sent_message.message_id}_{final_filename}")
         
-        # Copy file before cleaning up original
-        shutil.copy2(file_info['file_path'], new_file_path)
+        # Move the file instead of copying it, then drop the operation's scratch files
+        await asyncio.to_thread(_move_file, file_info.file_path, new_file_path)
+        await asyncio.to_thread(_discard_workdir, os.path.dirname(file_info.file_path))
         
-        # Add to user files with new message ID
-        user_files[user_id].append({
-            'name': final_filename,
-            'path': new_file_path,
-            'message_id': sent_message.message_id
-        })
+        # Store the sent file with its new message ID for future reply commands
+        files = await _files_for(user_id, context)
+        files.add(
+            FileEntry(name=final_filename, path=new_file_path, message_id=sent_message.message_id)
+        )
         
-        # Clean up original file
-        os.remove(file_info['file_path'])
-        del pending_files[user_id]
+        context.user_data.pop('pending', None)
         
         # Update status message
         await status_msg.edit_text(f"✅ File sent as `{final_filename}`! You can now reply to it with commands.")
         
     except Exception as e:
-        await update.message.reply_text(f"❌ Error sending file: {str(e)}")
-        if user_id in pending_files:
-            del pending_files[user_id]
+        await status_msg.edit_text(f"❌ Error sending file: {str(e)}")
+        context.user_data.pop('pending', None)
+        await asyncio.to_thread(_discard_workdir, os.path.dirname(file_info.file_path))
     
     return ConversationHandler.END
 
@@ -386,48 +707,45 @@ async def cancel_rename(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel the rename operation"""
     user_id = update.effective_user.id
     
-    if user_id in pending_files:
+    file_info = context.user_data.get('pending')
+    if file_info is not None:
         # Send with default name
-        file_info = pending_files[user_id]
-        default_filename = f"document.{file_info['file_type'].split('.')[-1]}"
+        default_filename = f"document{file_info.ext}"
         
         try:
-            with open(file_info['file_path'], 'rb') as f:
-                sent_message = await file_info['message_to_reply'].reply_document(
-                    document=f,
-                    filename=default_filename,
-                    caption=f"📄 **{default_filename}**\n{file_info['operation_info']}",
-                    read_timeout=30,
-                    write_timeout=30,
-                    connect_timeout=10
-                )
-            
-            # Store the sent file for future reply commands
-            if user_id not in user_files:
-                user_files[user_id] = []
+            # Read off the event loop so other users' updates keep flowing
+            file_data = await asyncio.to_thread(_read_bytes, file_info.file_path)
+            sent_message = await file_info.message_to_reply.reply_document(
+                document=file_data,
+                filename=default_filename,
+                caption=f"📄 **{default_filename}**\n{file_info.operation_info}",
+                read_timeout=30,
+                write_timeout=30,
+                connect_timeout=10
+            )
+            del file_data
             
-            # Create a copy of the file for reply functionality
-            temp_dir = tempfile.mkdtemp()
-            new_file_path = os.path.join(temp_dir, default_filename)
+            # Keep the file for reply functionality
+            temp_dir = await asyncio.to_thread(_user_dir, user_id)
+            new_file_path = os.path.join(temp_dir, f"{sent_message.message_id}_{default_filename}")
             
-            # Copy file before cleaning up original
-            shutil.copy2(file_info['file_path'], new_file_path)
+            # Move the file instead of copying it, then drop the operation's scratch files
+            await asyncio.to_thread(_move_file, file_info.file_path, new_file_path)
+            await asyncio.to_thread(_discard_workdir, os.path.dirname(file_info.file_path))
             
-            # Add to user files with new message ID
-            user_files[user_id].append({
-                'name': default_filename,
-                'path': new_file_path,
-                'message_id': sent_message.message_id
-            })
+            # Store the sent file with its new message ID for future reply commands
+            files = await _files_for(user_id, context)
+            files.add(
+                FileEntry(name=default_filename, path=new_file_path, message_id=sent_message.message_id)
+            )
             
-            os.remove(file_info['file_path'])
-            del pending_files[user_id]
+            context.user_data.pop('pending', None)
             await update.message.reply_text("✅ File sent with default name! You can now reply to it with commands.")
             
         except Exception as e:
             await update.message.reply_text(f"❌ Error sending file: {str(e)}")
-            if user_id in pending_files:
-                del pending_files[user_id]
+            context.user_data.pop('pending', None)
+            await asyncio.to_thread(_discard_workdir, os.path.dirname(file_info.file_path))
     else:
         await update.message.reply_text("❌ No pending file to cancel.")
     
@@ -436,50 +754,44 @@ async def cancel_rename(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def list_files_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List all uploaded files"""
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
-    if user_id not in user_files or len(user_files[user_id]) == 0:
+    files = user_files.get(user_id)
+    if not files:
         await update.message.reply_text("📁 No files uploaded yet! Send me a PDF or image file to get started.")
         return
     
-    # Separate files by type
-    pdf_files = [f for f in user_files[user_id] if f.get('type', 'pdf') == 'pdf']
-    image_files = [f for f in user_files[user_id] if f.get('type') == 'image']
-    
-    file_list = "📁 **Your uploaded files:**\n\n"
+    parts = ["📁 **Your uploaded files:**\n\n"]
     
-    if pdf_files:
-        file_list += "📄 **PDFs:**\n"
-        for i, file_info in enumerate(pdf_files, 1):
-            file_list += f"{i}. {file_info['name']}\n"
-        file_list += "\n"
+    if files.pdfs:
+        parts.append("📄 **PDFs:**\n")
+        parts.extend(f"{i}. {file_info.name}\n" for i, file_info in enumerate(files.pdfs, 1))
+        parts.append("\n")
     
-    if image_files:
-        file_list += "🖼️ **Images:**\n"
-        for i, file_info in enumerate(image_files, 1):
-            file_list += f"{i}. {file_info['name']}\n"
-        file_list += "\n"
+    if files.images:
+        parts.append("🖼️ **Images:**\n")
+        parts.extend(f"{i}. {file_info.name}\n" for i, file_info in enumerate(files.images, 1))
+        parts.append("\n")
     
-    file_list += f"📊 **Total:** {len(user_files[user_id])} files"
+    parts.append(f"📊 **Total:** {len(files)} files")
     
-    await update.message.reply_text(file_list)
+    await update.message.reply_text("".join(parts))
 
 async def clear_files_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear all uploaded files"""
     user_id = update.effective_user.id
     
-    if user_id in user_files:
-        # Clean up temporary files
-        for file_info in user_files[user_id]:
-            try:
-                os.remove(file_info['path'])
-            except:
-                pass
-        del user_files[user_id]
+    user_files.pop(user_id, None)
+    # An unsent result lives in the user's directory too, so forget it along with the files
+    context.user_data.pop('pending', None)
+    temp_dir = _user_tmpdirs.pop(user_id, None)
+    if temp_dir:
+        await asyncio.to_thread(_discard_workdir, temp_dir)
     
     await update.message.reply_text("🗑️ All uploaded files cleared!")
 
-async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle PDF document uploads with memory optimization"""
+async def _store_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Download and store an upload already known to be a PDF"""
     user_id = update.effective_user.id
     
     # Memory check first
@@ -487,10 +799,6 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Service busy. Please try again in a moment.")
         return
     
-    if not update.message.document.mime_type == 'application/pdf':
-        await update.message.reply_text("❌ Please send PDF files only.")
-        return
-    
     # Check file size before download
     file_size_mb = update.message.document.file_size / 1024 / 1024
     if file_size_mb > MAX_FILE_SIZE_MB:
@@ -505,50 +813,37 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         # Download file with memory monitoring
         file = await update.message.document.get_file()
-        temp_dir = tempfile.mkdtemp()
-        file_path = os.path.join(temp_dir, update.message.document.file_name)
-        await file.download_to_drive(file_path)
+        temp_dir = await asyncio.to_thread(_user_dir, user_id)
+        # Prefix with the message id so same-named uploads don't overwrite each other
+        file_path = os.path.join(temp_dir, f"{update.message.message_id}_{update.message.document.file_name}")
+        await download_to_path(file, file_path)
         
         # Check memory after download
         if not check_memory_limit():
             # Cleanup and abort
-            try:
-                os.remove(file_path)
-                os.rmdir(temp_dir)
-            except:
-                pass
+            await remove_files([file_path])
             await update.message.reply_text("⚠️ Memory limit reached. File removed.")
             return
         
         # Store file info
-        if user_id not in user_files:
-            user_files[user_id] = []
-        
-        file_number = len(user_files[user_id]) + 1
-        user_files[user_id].append({
-            'name': update.message.document.file_name,
-            'path': file_path,
-            'message_id': update.message.message_id
-        })
+        files = await _files_for(user_id, context)
+        file_number = len(files) + 1
+        files.add(FileEntry(
+            name=update.message.document.file_name,
+            path=file_path,
+            message_id=update.message.message_id
+        ))
         
         await update.message.reply_text(f"📄 PDF uploaded as file #{file_number}: {update.message.document.file_name}")
         
     except Exception as e:
         await update.message.reply_text(f"❌ Error processing PDF: {str(e)}")
 
-async def handle_image_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle image uploads and store for PDF conversion"""
+async def _store_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Download and store an upload already known to be an image"""
     user_id = update.effective_user.id
-    
-    # Check file type
-    mime_type = update.message.document.mime_type
     file_name = update.message.document.file_name
     
-    # Check if it's an image
-    if not (mime_type and mime_type.startswith('image/')):
-        await update.message.reply_text("❌ Please send image files only.")
-        return
-    
     # Performance optimization: limit files per user
     if user_id in user_files and len(user_files[user_id]) >= MAX_FILES_PER_USER:
         await update.message.reply_text(f"⚠️ File limit reached ({MAX_FILES_PER_USER}). Use /clear to remove old files.")
@@ -560,24 +855,22 @@ async def handle_image_document(update: Update, context: ContextTypes.DEFAULT_TY
     try:
         # Download file
         file = await update.message.document.get_file()
-        temp_dir = tempfile.mkdtemp()
-        image_file_path = os.path.join(temp_dir, file_name)
-        await file.download_to_drive(image_file_path)
+        temp_dir = await asyncio.to_thread(_user_dir, user_id)
+        image_file_path = os.path.join(temp_dir, f"{update.message.message_id}_{file_name}")
+        await download_to_path(file, image_file_path)
         
         # Store image in user files for combining
-        if user_id not in user_files:
-            user_files[user_id] = []
-        
-        user_files[user_id].append({
-            'name': file_name,
-            'path': image_file_path,
-            'type': 'image',
-            'size': update.message.document.file_size
-        })
+        files = await _files_for(user_id, context)
+        files.add(FileEntry(
+            name=file_name,
+            path=image_file_path,
+            kind='image',
+            size=update.message.document.file_size
+        ))
         
         await status_message.edit_text(
             f"✅ Image received: {file_name}\n\n"
-            f"📁 Your uploaded images: {len([f for f in user_files[user_id] if f['type'] == 'image'])}\n\n"
+            f"📁 Your uploaded images: {len(files.images)}\n\n"
             f"📋 Options:\n"
             f"• Upload more images and use /combine_images\n"
             f"• Use /convert_image to convert this image to PDF\n"
@@ -587,24 +880,20 @@ async def handle_image_document(update: Update, context: ContextTypes.DEFAULT_TY
     except Exception as e:
         error_msg = str(e)
         await status_message.edit_text(f"❌ Error processing image: {error_msg}")
-        await status_message.edit_text(f"❌ Error converting image: {error_msg}")
 
 async def handle_any_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle any document upload and route to appropriate handler"""
-    # Emergency wake for file uploads (critical operation)
-    emergency_wake()
     await wake_service_on_activity()
     
     mime_type = update.message.document.mime_type
-    file_name = update.message.document.file_name.lower() if update.message.document.file_name else ""
     
     # Check if it's a PDF
-    if mime_type == 'application/pdf':
-        return await handle_document(update, context)
+    if mime_type == _PDF_MIME:
+        return await _store_pdf(update, context)
     
     # Check if it's an image
-    elif mime_type and mime_type.startswith('image/'):
-        return await handle_image_document(update, context)
+    elif mime_type and mime_type.startswith(_IMAGE_MIME_PREFIX):
+        return await _store_image(update, context)
     
     # Unsupported file type
     else:
@@ -616,37 +905,10 @@ async def handle_any_document(update: Update, context: ContextTypes.DEFAULT_TYPE
             "💡 Upload one of these file types to get started!"
         )
 
-async def merge_with_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show merge options when replying to a PDF"""
-    user_id = update.effective_user.id
-    
-    replied_pdf = find_replied_pdf(update, user_id)
-    if not replied_pdf:
-        await update.message.reply_text("❌ Please reply to a PDF file to merge with others.")
-        return
-    
-    if user_id not in user_files or len(user_files[user_id]) <= 1:
-        await update.message.reply_text("❌ You need at least 2 PDFs to merge. Upload more files first.")
-        return
-    
-    # Show available files to merge with
-    merge_list = f"🔗 **Merge {replied_pdf['name']} with:**\n\n"
-    merge_list += "Available files:\n"
-    for i, file_info in enumerate(user_files[user_id], 1):
-        if file_info['message_id'] != replied_pdf['message_id']:
-            merge_list += f"{i}. {file_info['name']}\n"
-    
-    merge_list += f"\n💡 **Usage:** Reply with /merge to include this PDF in merge order"
-    
-    await update.message.reply_text(merge_list)
-
-
-
-
-
 async def merge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Memory-optimized merge PDF command handler"""
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
     # Memory check before processing
     if not check_memory_limit():
@@ -662,70 +924,59 @@ async def merge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if replied_pdf:
         # Reply mode: show list of other files to merge with
-        other_files = [f for f in user_files[user_id] if f != replied_pdf]
-        
-        if not other_files:
+        if len(user_files[user_id]) < 2:
             await update.message.reply_text("❌ No other files available to merge with this PDF!")
             return
         
-        file_list = f"📋 **Merge with {replied_pdf['name']}**\n\nChoose files to merge:\n\n"
-        for i, file_info in enumerate(other_files, 1):
-            file_list += f"{i}. {file_info['name']}\n"
-        
-        file_list += f"\n💡 Use: `/merge_with 1,2,3` to merge selected files with {replied_pdf['name']}"
-        
-        await update.message.reply_text(file_list)
+        # Keep upload-order numbers so they match what /merge_with expects
+        await update.message.reply_text(
+            f"📋 **Merge with {replied_pdf.name}**\n\nChoose files to merge:\n\n"
+            + _format_file_list(user_files[user_id].entries, exclude=replied_pdf)
+            + f"\n💡 Use: `/merge_with 1,2,3` to merge selected files with {replied_pdf.name}"
+        )
         return
     
     # Regular merge logic
+    temp_dir = None
     try:
-        all_files = user_files[user_id]
+        all_files = user_files[user_id].entries
         
         if len(context.args) > 0:
             # Parse specific file numbers
             try:
-                file_numbers = [int(x.strip()) for x in context.args[0].split(',')]
-                selected_files = []
-                file_names = []
-                
-                for num in file_numbers:
-                    if 1 <= num <= len(all_files):
-                        selected_files.append(all_files[num-1])
-                        file_names.append(all_files[num-1]['name'])
-                    else:
-                        await update.message.reply_text(f"❌ File #{num} doesn't exist. Use /list to see available files.")
-                        return
-                
+                file_numbers = _parse_file_numbers(context.args[0], len(all_files))
             except ValueError:
                 await update.message.reply_text("❌ Invalid format. Use: /merge 1,2,3")
                 return
+            except IndexError as e:
+                await update.message.reply_text(f"❌ File #{e.args[0]} doesn't exist. Use /list to see available files.")
+                return
+            
+            selected_files = [all_files[num-1] for num in file_numbers]
+            file_names = [f.name for f in selected_files]
         else:
             # Merge all files
             selected_files = all_files
-            file_names = [f['name'] for f in selected_files]
+            file_names = [f.name for f in selected_files]
         
         if len(selected_files) < 2:
             await update.message.reply_text("Need at least 2 files to merge!")
             return
         
-        # Show processing status
-        status_message = await update.message.reply_text(f"🔄 Merging {len(selected_files)} PDF files...")
-        
-        # Create temporary output file
-        temp_dir = tempfile.mkdtemp()
-        merged_file = os.path.join(temp_dir, "merged.pdf")
-        
         # Merge PDFs using lazy import
-        merge_pdfs, _, _, _, _ = lazy_import_pdf_utils()
+        merge_pdfs = lazy_import_pdf_utils().merge_pdfs
         if merge_pdfs is None:
             await update.message.reply_text("❌ PDF utilities not available.")
             return
         
-        file_paths = [f['path'] for f in selected_files]
-        merge_pdfs(file_paths, merged_file)
+        # Create temporary output file
+        temp_dir = await asyncio.to_thread(_new_workdir, user_id)
+        merged_file = os.path.join(temp_dir, "merged.pdf")
         
-        # Update status
-        await status_message.edit_text(f"✅ Merge completed!")
+        file_paths = [f.path for f in selected_files]
+        async with StatusReporter(update.message, f"🔄 Merging {len(selected_files)} PDF files...") as status:
+            await run_pdf_job(merge_pdfs, file_paths, merged_file)
+            await status.done("✅ Merge completed!")
         
         # Create merge summary
         merge_summary = f"Successfully merged {len(selected_files)} PDF files!\n\nMerged files:\n" + "\n".join([f"• {name}" for name in file_names])
@@ -733,19 +984,26 @@ async def merge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Ask for filename instead of sending directly
         return await ask_for_filename(update, context, merged_file, "pdf", merge_summary)
         
-    except Exception as e:
-        error_msg = str(e)
-        if "timed out" in error_msg.lower():
+    except TimedOut:
+        # Keep the scratch files only if the result is already waiting for a filename
+        if temp_dir and _holds_pending(context, temp_dir):
             await update.message.reply_text(
                 "⚠️ Processing took longer than expected, but your files are likely being merged.\n"
                 "Please wait a moment for the result."
             )
-        else:
-            await update.message.reply_text(f"❌ Error merging PDFs: {error_msg}")
+            return
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
+        await update.message.reply_text("⚠️ Telegram timed out before the result was ready. Please try /merge again.")
+    except Exception as e:
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
+        await update.message.reply_text(f"❌ Error merging PDFs: {e}")
 
 async def merge_with_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Merge with replied PDF using specified file numbers"""
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
     if user_id not in user_files or len(user_files[user_id]) == 0:
         await update.message.reply_text("Please upload PDF files first.")
@@ -755,64 +1013,59 @@ async def merge_with_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     replied_pdf = find_replied_pdf(update, user_id)
     if not replied_pdf:
         # Show available files to merge with if no reply
-        file_list = "🔗 **Available PDFs to merge:**\n\n"
-        for i, file_info in enumerate(user_files[user_id], 1):
-            file_list += f"{i}. {file_info['name']}\n"
-        file_list += f"\n💡 Use: `/merge_with 1,2,3` to merge selected files\n💡 Or reply to a PDF and use `/merge_with 1,2` to merge with it"
-        await update.message.reply_text(file_list)
+        await update.message.reply_text(
+            "🔗 **Available PDFs to merge:**\n\n"
+            + _format_file_list(user_files[user_id].entries)
+            + "\n💡 Use: `/merge_with 1,2,3` to merge selected files\n💡 Or reply to a PDF and use `/merge_with 1,2` to merge with it"
+        )
         return
     
     if not context.args:
         # Show available files to merge with the replied PDF
-        merge_list = f"🔗 **Merge '{replied_pdf['name']}' with:**\n\n"
-        merge_list += "Available files:\n"
-        for i, file_info in enumerate(user_files[user_id], 1):
-            if file_info['message_id'] != replied_pdf['message_id']:
-                merge_list += f"{i}. {file_info['name']}\n"
-        merge_list += f"\n💡 **Usage:** `/merge_with 1,2,3` (file numbers to merge with {replied_pdf['name']})"
-        await update.message.reply_text(merge_list)
+        await update.message.reply_text(
+            f"🔗 **Merge '{replied_pdf.name}' with:**\n\n"
+            "Available files:\n"
+            + _format_file_list(user_files[user_id].entries, exclude=replied_pdf)
+            + f"\n💡 **Usage:** `/merge_with 1,2,3` (file numbers to merge with {replied_pdf.name})"
+        )
         return
     
+    temp_dir = None
     try:
         # Parse file numbers from all files (including the replied one)
-        file_numbers = [int(x.strip()) for x in context.args[0].split(',')]
-        selected_files = [replied_pdf]  # Start with replied PDF
-        file_names = [replied_pdf['name']]
+        all_files = user_files[user_id].entries
+        try:
+            file_numbers = _parse_file_numbers(context.args[0], len(all_files))
+        except ValueError:
+            await update.message.reply_text("❌ Invalid format. Use: /merge_with 1,2,3")
+            return
+        except IndexError as e:
+            await update.message.reply_text(f"❌ File #{e.args[0]} doesn't exist. Use /list to see available files.")
+            return
         
-        # Add other selected files
-        for num in file_numbers:
-            if 1 <= num <= len(user_files[user_id]):
-                selected_file = user_files[user_id][num-1]
-                # Don't add the replied PDF twice
-                if selected_file['message_id'] != replied_pdf['message_id']:
-                    selected_files.append(selected_file)
-                    file_names.append(selected_file['name'])
-            else:
-                await update.message.reply_text(f"❌ File #{num} doesn't exist. Use /list to see available files.")
-                return
+        # Start with the replied PDF; skip its own number so it isn't added twice
+        replied_number = next(i for i, f in enumerate(all_files, 1) if f is replied_pdf)
+        selected_files = [replied_pdf] + [all_files[num - 1] for num in file_numbers if num != replied_number]
+        file_names = [f.name for f in selected_files]
         
         if len(selected_files) < 2:
             await update.message.reply_text("❌ You need at least 2 files to merge. Select more files.")
             return
         
-        # Show processing status
-        status_message = await update.message.reply_text(f"🔄 Merging {len(selected_files)} PDF files...")
-        
-        # Create temporary output file
-        temp_dir = tempfile.mkdtemp()
-        merged_file = os.path.join(temp_dir, "merged.pdf")
-        
         # Merge PDFs using lazy import
-        merge_pdfs, _, _, _, _ = lazy_import_pdf_utils()
+        merge_pdfs = lazy_import_pdf_utils().merge_pdfs
         if merge_pdfs is None:
             await update.message.reply_text("❌ PDF utilities not available.")
             return
         
-        file_paths = [f['path'] for f in selected_files]
-        merge_pdfs(file_paths, merged_file)
+        # Create temporary output file
+        temp_dir = await asyncio.to_thread(_new_workdir, user_id)
+        merged_file = os.path.join(temp_dir, "merged.pdf")
         
-        # Update status
-        await status_message.edit_text(f"✅ Merge completed!")
+        file_paths = [f.path for f in selected_files]
+        async with StatusReporter(update.message, f"🔄 Merging {len(selected_files)} PDF files...") as status:
+            await run_pdf_job(merge_pdfs, file_paths, merged_file)
+            await status.done("✅ Merge completed!")
         
         # Create merge summary
         merge_summary = f"Successfully merged {len(selected_files)} PDF files!\n\nMerged files:\n" + "\n".join([f"• {name}" for name in file_names])
@@ -821,11 +1074,52 @@ async def merge_with_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return await ask_for_filename(update, context, merged_file, "pdf", merge_summary)
     
     except Exception as e:
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
         await update.message.reply_text(f"❌ Error merging PDFs: {str(e)}")
 
+async def _run_split(update: Update, context: ContextTypes.DEFAULT_TYPE, selected_file, page_range):
+    """Extract page_range from a stored PDF and ask for the result's filename"""
+    # Split PDF using lazy import
+    split_pdf = lazy_import_pdf_utils().split_pdf
+    if split_pdf is None:
+        await update.message.reply_text("❌ PDF utilities not available.")
+        return
+    
+    temp_dir = None
+    try:
+        # Create output directory
+        temp_dir = await asyncio.to_thread(_new_workdir, update.effective_user.id)
+        output_path = os.path.join(temp_dir, f"split_{selected_file.name}")
+        
+        async with StatusReporter(update.message, f"🔄 Splitting {selected_file.name}...") as status:
+            split_file = await run_pdf_job(split_pdf, selected_file.path, page_range, output_path)
+            await status.done("✅ Split completed!")
+        
+        # Ask for filename instead of sending directly
+        operation_info = f"Extracted pages {page_range} from {selected_file.name}!"
+        return await ask_for_filename(update, context, split_file, "pdf", operation_info)
+        
+    except TimedOut:
+        # Keep the scratch files only if the result is already waiting for a filename
+        if temp_dir and _holds_pending(context, temp_dir):
+            await update.message.reply_text(
+                "⚠️ Processing took longer than expected, but your file is likely being split.\n"
+                "Please wait a moment for the result."
+            )
+            return
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
+        await update.message.reply_text("⚠️ Telegram timed out before the result was ready. Please try /split again.")
+    except Exception as e:
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
+        await update.message.reply_text(f"❌ Error splitting PDF: {e}")
+
 async def split_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Split PDF command handler"""
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
     if user_id not in user_files or len(user_files[user_id]) == 0:
         await update.message.reply_text("Please upload a PDF file before splitting.")
@@ -838,52 +1132,14 @@ async def split_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Reply mode: use the replied PDF directly
         if not context.args:
             await update.message.reply_text(
-                f"📄 **Split {replied_pdf['name']}**\n\n"
+                f"📄 **Split {replied_pdf.name}**\n\n"
                 "Please specify page range:\n"
                 "• Reply with: `/split 5-8` (pages 5 to 8)\n"
                 "• Reply with: `/split 3` (page 3 only)"
             )
             return
         
-        page_range = " ".join(context.args)
-        selected_file = replied_pdf
-        
-        try:
-            # Show processing status
-            status_message = await update.message.reply_text(f"🔄 Splitting {selected_file['name']}...")
-            
-            # Create output directory
-            temp_dir = tempfile.mkdtemp()
-            output_filename = f"split_{selected_file['name']}"
-            output_path = os.path.join(temp_dir, output_filename)
-            
-            pdf_path = selected_file['path']
-            
-            # Split PDF using lazy import
-            _, split_pdf, _, _, _ = lazy_import_pdf_utils()
-            if split_pdf is None:
-                await status_message.edit_text("❌ PDF utilities not available.")
-                return
-            
-            split_file = split_pdf(pdf_path, page_range, output_path)
-            
-            # Update status
-            await status_message.edit_text(f"✅ Split completed!")
-            
-            # Ask for filename instead of sending directly
-            operation_info = f"Extracted pages {page_range} from {selected_file['name']}!"
-            return await ask_for_filename(update, context, split_file, "pdf", operation_info)
-        
-        except Exception as e:
-            error_msg = str(e)
-            if "timed out" in error_msg.lower():
-                await update.message.reply_text(
-                    "⚠️ Processing took longer than expected, but your file is likely being split.\n"
-                    "Please wait a moment for the result."
-                )
-            else:
-                await update.message.reply_text(f"❌ Error splitting PDF: {error_msg}")
-        return
+        return await _run_split(update, context, replied_pdf, " ".join(context.args))
     
     # Regular split command logic
     if len(context.args) < 2:
@@ -899,50 +1155,43 @@ async def split_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         file_number = int(context.args[0])
-        page_range = " ".join(context.args[1:])
-        
-        if file_number < 1 or file_number > len(user_files[user_id]):
-            await update.message.reply_text("❌ Invalid file number. Use /list to see your files.")
-            return
-        
-        selected_file = user_files[user_id][file_number - 1]
-        
-        # Show processing status
-        status_message = await update.message.reply_text(f"🔄 Splitting {selected_file['name']}...")
-        
+    except ValueError:
+        await update.message.reply_text("❌ Invalid file number. Please use a valid number from your file list.")
+        return
+    
+    if file_number < 1 or file_number > len(user_files[user_id]):
+        await update.message.reply_text("❌ Invalid file number. Use /list to see your files.")
+        return
+    
+    selected_file = user_files[user_id].entries[file_number - 1]
+    return await _run_split(update, context, selected_file, " ".join(context.args[1:]))
+
+async def _run_to_images(update: Update, context: ContextTypes.DEFAULT_TYPE, selected_file):
+    """Render a stored PDF's pages into a ZIP and ask for its filename"""
+    # Get PDF utilities
+    pdf_to_images_zip = lazy_import_pdf_utils().pdf_to_images_zip
+    if pdf_to_images_zip is None:
+        await update.message.reply_text("❌ PDF utilities not available.")
+        return
+    
+    temp_dir = None
+    try:
         # Create output directory
-        temp_dir = tempfile.mkdtemp()
-        output_filename = f"split_{selected_file['name']}"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        pdf_path = selected_file['path']
+        temp_dir = await asyncio.to_thread(_new_workdir, update.effective_user.id)
         
-        # Split PDF using lazy import
-        _, split_pdf, _, _, _ = lazy_import_pdf_utils()
-        if split_pdf is None:
-            await status_message.edit_text("❌ PDF utilities not available.")
-            return
-        
-        split_file = split_pdf(pdf_path, page_range, output_path)
-        
-        # Update status
-        await status_message.edit_text(f"✅ Split completed!")
+        # Render pages straight into the ZIP file
+        zip_filename = f"images_{selected_file.name.replace('.pdf', '')}.zip"
+        zip_path = os.path.join(temp_dir, zip_filename)
+        zip_file, page_count = await run_pdf_job(pdf_to_images_zip, selected_file.path, zip_path)
         
         # Ask for filename instead of sending directly
-        operation_info = f"Extracted pages {page_range} from {selected_file['name']}!"
-        return await ask_for_filename(update, context, split_file, "pdf", operation_info)
+        operation_info = f"Converted {page_count} pages from {selected_file.name} to images!"
+        return await ask_for_filename(update, context, zip_file, "zip", operation_info)
         
-    except ValueError:
-        await update.message.reply_text("❌ Invalid file number. Please use a valid number from your file list.")
     except Exception as e:
-        error_msg = str(e)
-        if "timed out" in error_msg.lower():
-            await update.message.reply_text(
-                "⚠️ Processing took longer than expected, but your file is likely being split.\n"
-                "Please wait a moment for the result."
-            )
-        else:
-            await update.message.reply_text(f"❌ Error splitting PDF: {error_msg}")
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
+        await update.message.reply_text(f"❌ Error converting PDF to images: {e}")
 
 async def to_images_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Convert PDF to images command handler"""
@@ -953,89 +1202,35 @@ async def to_images_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await wake_service_on_activity()
     
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
     # Check if this is a reply to a PDF
     replied_pdf = find_replied_pdf(update, user_id)
     
     if replied_pdf:
         # Reply mode: use the replied PDF directly
-        selected_file = replied_pdf
-        
-        try:
-            pdf_path = selected_file['path']
-            
-            # Create output directory
-            temp_dir = tempfile.mkdtemp()
-            images_dir = os.path.join(temp_dir, "images")
-            
-            # Get PDF utilities
-            _, _, pdf_to_images_func, create_zip_from_images, _ = lazy_import_pdf_utils()
-            if pdf_to_images_func is None or create_zip_from_images is None:
-                await update.message.reply_text("❌ PDF utilities not available.")
-                return
-            
-            # Convert to images
-            image_paths = pdf_to_images_func(pdf_path, images_dir)
-            
-            # Create ZIP file
-            zip_filename = f"images_{selected_file['name'].replace('.pdf', '')}.zip"
-            zip_path = os.path.join(temp_dir, zip_filename)
-            zip_file = create_zip_from_images(image_paths, zip_path)
-            
-            # Ask for filename instead of sending directly
-            operation_info = f"Converted {len(image_paths)} pages from {selected_file['name']} to images!"
-            return await ask_for_filename(update, context, zip_file, "zip", operation_info)
-            
-        except Exception as e:
-            error_msg = str(e)
-            await update.message.reply_text(f"❌ Error converting PDF to images: {error_msg}")
-        return
+        return await _run_to_images(update, context, replied_pdf)
     
     # Regular to_images command logic
     if user_id not in user_files or not user_files[user_id]:
         await update.message.reply_text("❌ No PDFs uploaded. Please upload a PDF first.")
         return
-        
-    try:
-        if len(context.args) > 0:
+    
+    if len(context.args) > 0:
+        try:
             file_number = int(context.args[0])
-            if file_number < 1 or file_number > len(user_files[user_id]):
-                await update.message.reply_text("❌ Invalid file number. Use /list to see your files.")
-                return
-            selected_file = user_files[user_id][file_number - 1]
-        else:
-            # Use the latest uploaded file
-            selected_file = user_files[user_id][-1]
-        
-        pdf_path = selected_file['path']
-        
-        # Create output directory
-        temp_dir = tempfile.mkdtemp()
-        images_dir = os.path.join(temp_dir, "images")
-        
-        # Get PDF utilities
-        _, _, pdf_to_images_func, create_zip_from_images, _ = lazy_import_pdf_utils()
-        if pdf_to_images_func is None or create_zip_from_images is None:
-            await update.message.reply_text("❌ PDF utilities not available.")
+        except ValueError:
+            await update.message.reply_text("❌ Invalid file number. Use /list to see your files.")
             return
-        
-        # Convert to images
-        image_paths = pdf_to_images_func(pdf_path, images_dir)
-        
-        # Create ZIP file
-        zip_filename = f"images_{selected_file['name'].replace('.pdf', '')}.zip"
-        zip_path = os.path.join(temp_dir, zip_filename)
-        zip_file = create_zip_from_images(image_paths, zip_path)
-        
-        # Ask for filename instead of sending directly
-        operation_info = f"Converted {len(image_paths)} pages from {selected_file['name']} to images!"
-        return await ask_for_filename(update, context, zip_file, "zip", operation_info)
-        
-    except ValueError:
-        await update.message.reply_text("❌ Invalid file number. Use /list to see your files.")
-    except Exception as e:
-        error_msg = str(e)
-        await update.message.reply_text(f"❌ Error converting PDF to images: {error_msg}")
+        if file_number < 1 or file_number > len(user_files[user_id]):
+            await update.message.reply_text("❌ Invalid file number. Use /list to see your files.")
+            return
+        selected_file = user_files[user_id].entries[file_number - 1]
+    else:
+        # Use the latest uploaded file
+        selected_file = user_files[user_id].entries[-1]
+    
+    return await _run_to_images(update, context, selected_file)
 
 async def convert_image_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Convert a single image to PDF"""
@@ -1046,47 +1241,53 @@ async def convert_image_command(update: Update, context: ContextTypes.DEFAULT_TY
     await wake_service_on_activity()
     
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
     if user_id not in user_files or not user_files[user_id]:
         await update.message.reply_text("❌ No files uploaded. Please upload an image first.")
         return
     
     # Find image files
-    image_files = [f for f in user_files[user_id] if f.get('type') == 'image']
+    image_files = user_files[user_id].images
     if not image_files:
         await update.message.reply_text("❌ No image files found. Please upload an image first.")
         return
     
-    try:
-        # Use specified image or latest
-        if len(context.args) > 0:
+    # Use specified image or latest
+    if len(context.args) > 0:
+        try:
             file_number = int(context.args[0])
-            if file_number < 1 or file_number > len(image_files):
-                await update.message.reply_text(f"❌ Invalid image number. You have {len(image_files)} images.")
-                return
-            selected_file = image_files[file_number - 1]
-        else:
-            selected_file = image_files[-1]  # Latest image
-        
-        # Convert to PDF
-        temp_dir = tempfile.mkdtemp()
-        pdf_filename = selected_file['name'].rsplit('.', 1)[0] + '.pdf'
-        pdf_file_path = os.path.join(temp_dir, pdf_filename)
-        
-        _, _, _, _, image_to_pdf = lazy_import_pdf_utils()
+        except ValueError:
+            await update.message.reply_text("❌ Invalid image number.")
+            return
+        if file_number < 1 or file_number > len(image_files):
+            await update.message.reply_text(f"❌ Invalid image number. You have {len(image_files)} images.")
+            return
+        selected_file = image_files[file_number - 1]
+    else:
+        selected_file = image_files[-1]  # Latest image
+    
+    temp_dir = None
+    try:
+        image_to_pdf = lazy_import_pdf_utils().image_to_pdf
         if image_to_pdf is None:
             await update.message.reply_text("❌ PDF utilities not available.")
             return
         
-        image_to_pdf(selected_file['path'], pdf_file_path)
+        # Convert to PDF
+        temp_dir = await asyncio.to_thread(_new_workdir, user_id)
+        pdf_filename = selected_file.name.rsplit('.', 1)[0] + '.pdf'
+        pdf_file_path = os.path.join(temp_dir, pdf_filename)
+        
+        await run_pdf_job(image_to_pdf, selected_file.path, pdf_file_path)
         
         # Ask for filename
-        operation_info = f"Converted image '{selected_file['name']}' to PDF!"
+        operation_info = f"Converted image '{selected_file.name}' to PDF!"
         return await ask_for_filename(update, context, pdf_file_path, "pdf", operation_info)
         
-    except ValueError:
-        await update.message.reply_text("❌ Invalid image number.")
     except Exception as e:
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
         await update.message.reply_text(f"❌ Error converting image: {e}")
 
 async def combine_images_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1098,174 +1299,138 @@ async def combine_images_command(update: Update, context: ContextTypes.DEFAULT_T
     await wake_service_on_activity()
     
     user_id = update.effective_user.id
+    _touch_user(user_id)
     
     if user_id not in user_files or not user_files[user_id]:
         await update.message.reply_text("❌ No files uploaded. Please upload images first.")
         return
     
     # Find image files
-    image_files = [f for f in user_files[user_id] if f.get('type') == 'image']
+    image_files = user_files[user_id].images
     if len(image_files) < 2:
         await update.message.reply_text(f"❌ Need at least 2 images to combine. You have {len(image_files)} images.")
         return
     
+    temp_dir = None
     try:
-        status_message = await update.message.reply_text("🔄 Combining images into PDF...")
-        
         # Get image paths
-        image_paths = [f['path'] for f in image_files]
+        image_paths = [f.path for f in image_files]
+        
+        images_to_pdf = lazy_import_pdf_utils().images_to_pdf
+        if images_to_pdf is None:
+            await update.message.reply_text("❌ PDF utilities not available.")
+            return
         
         # Create combined PDF
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = await asyncio.to_thread(_new_workdir, user_id)
         pdf_filename = "combined_images.pdf"
         pdf_file_path = os.path.join(temp_dir, pdf_filename)
         
-        # Import images_to_pdf function
-        from utils.pdf_utils import images_to_pdf
-        images_to_pdf(image_paths, pdf_file_path)
-        
-        await status_message.edit_text("✅ Images combined successfully!")
+        async with StatusReporter(update.message, "🔄 Combining images into PDF...") as status:
+            await run_pdf_job(images_to_pdf, image_paths, pdf_file_path)
+            await status.done("✅ Images combined successfully!")
         
         # Ask for filename
         operation_info = f"Combined {len(image_files)} images into PDF!"
         return await ask_for_filename(update, context, pdf_file_path, "pdf", operation_info)
         
     except Exception as e:
+        if temp_dir:
+            await asyncio.to_thread(_discard_workdir, temp_dir)
         await update.message.reply_text(f"❌ Error combining images: {e}")
 
+_MERGE_WITH_HINT = (
+    "❓ Did you mean `/merge_with`?\n\n"
+    "💡 **Usage:**\n"
+    "• Reply to a PDF and use `/merge_with 1,2,3`\n"
+    "• Or use `/merge` to see merge options"
+)
+_UNKNOWN_COMMAND_TEXT = (
+    "❓ Unknown command. Use /help to see all available commands.\n\n"
+    "📋 **Quick commands:**\n"
+    "• /merge - Merge PDFs\n"
+    "• /split - Split PDF\n"
+    "• /to_images - Convert to images\n"
+    "• /merge_with - Merge with replied PDF\n"
+    "• /list - Show files\n"
+    "• /help - Full help"
+)
+# Common typos mapped to a targeted hint; anything else gets the generic reply
+_TYPO_HINTS = {
+    "/merge_wth": _MERGE_WITH_HINT,
+    "/mergewth": _MERGE_WITH_HINT,
+}
+
+async def handle_unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle unknown commands and suggest corrections"""
+    text = update.message.text.lower() if update.message.text else ""
+    if not text.startswith("/") or len(text) < 2:
+        return
+    
+    # "/cmd@BotName args" -> "/cmd"
+    command = text.split(maxsplit=1)[0].split("@", 1)[0]
+    await update.message.reply_text(_TYPO_HINTS.get(command, _UNKNOWN_COMMAND_TEXT))
+
+async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Route text no command handler claimed: a mistyped command or a filename for a pending result"""
+    if update.message.text.startswith("/"):
+        return await handle_unknown_command(update, context)
+    return await handle_filename_input(update, context)
+
 def start_bot():
     """Start the bot with conflict prevention"""
-    print("🔍 Testing PDF utilities import at startup...")
-    print(f"Current working directory: {os.getcwd()}")
-    
-    # Start auto-wake service to prevent sleeping
-    start_auto_wake_service()
+    log.info("🔍 Testing PDF utilities import at startup...")
+    log.info("Current working directory: %s", os.getcwd())
     
     # Test PDF utilities import
-    merge_pdfs, split_pdf, pdf_to_images, create_zip_from_images, image_to_pdf = lazy_import_pdf_utils()
-    if merge_pdfs is not None:
-        print("✅ PDF utilities loaded successfully")
+    if lazy_import_pdf_utils() is not _PDF_UTILS_MISSING:
+        log.info("✅ PDF utilities loaded successfully")
     else:
-        print("❌ PDF utilities failed to load")
+        log.error("❌ PDF utilities failed to load")
         
     BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_TOKEN')
     
     if BOT_TOKEN == 'YOUR_TOKEN':
-        print("❌ Please set your bot token!")
-        print("Set BOT_TOKEN environment variable or edit bot.py")
+        log.error("❌ Please set your bot token!")
+        log.error("Set BOT_TOKEN environment variable or edit bot.py")
         return
     
-    # Enhanced conflict prevention - clear webhooks and pending updates
-    try:
-        import telegram
-        bot = telegram.Bot(token=BOT_TOKEN)
-        
-        print("🔧 Checking for webhook conflicts...")
-        
-        # Get current webhook info
-        import asyncio
-        loop = asyncio.get_event_loop()
-        webhook_info = loop.run_until_complete(bot.get_webhook_info())
-        
-        if webhook_info.url:
-            print(f"🔍 Found existing webhook: {webhook_info.url}")
-            print("🗑️ Clearing webhook to enable polling...")
-            loop.run_until_complete(bot.delete_webhook(drop_pending_updates=True))
-            print("✅ Webhook cleared successfully")
-        else:
-            print("ℹ️ No webhook found - clearing pending updates...")
-            loop.run_until_complete(bot.delete_webhook(drop_pending_updates=True))
-            print("✅ Ready for polling")
-            
-        # Small delay to ensure Telegram servers process the webhook deletion
-        import time
-        time.sleep(2)
-        
-    except Exception as webhook_error:
-        print(f"⚠️ Could not clear webhook: {webhook_error}")
+    # run_polling() looks up the current event loop; create it explicitly
+    # (its bootstrap already deletes any webhook and drops pending updates)
+    asyncio.set_event_loop(asyncio.new_event_loop())
     
     # Configure HTTP timeouts in the application builder
-    app = ApplicationBuilder().token(BOT_TOKEN).read_timeout(30).write_timeout(30).connect_timeout(30).build()
-    
-    # Create conversation handler for filename input from commands
-    command_filename_handler = ConversationHandler(
-        entry_points=[
-            CommandHandler("merge", merge_command),
-            CommandHandler("split", split_command),
-            CommandHandler("to_images", to_images_command),
-            CommandHandler("merge_with", merge_with_command),
-            CommandHandler("convert_image", convert_image_command),
-            CommandHandler("combine_images", combine_images_command),
-        ],
-        states={
-            WAITING_FOR_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_filename_input)]
-        },
-        fallbacks=[CommandHandler("cancel", cancel_rename)],
-        per_message=False
+    # The health server and auto-wake run on the application's event loop once it is up
+    app = (
+        ApplicationBuilder()
+        .application_class(PageCraftApplication)
+        .concurrent_updates(True)
+        .token(BOT_TOKEN)
+        .read_timeout(30)
+        .write_timeout(30)
+        .connect_timeout(30)
+        .post_init(_on_startup)
+        .post_shutdown(_on_shutdown)
+        .build()
     )
     
-    # Create a global message handler for filename input
-    filename_input_handler = MessageHandler(
-        filters.TEXT & ~filters.COMMAND, 
-        handle_filename_input
-    )
-    
-    # Add handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("list", list_files_command))
-    app.add_handler(CommandHandler("clear", clear_files_command))
-    
-    # Add document handler BEFORE conversation handler
-    app.add_handler(MessageHandler(filters.Document.ALL, handle_any_document))
-    
-    # Add conversation handler for commands
-    app.add_handler(command_filename_handler)
-    
-    # Add global filename input handler
-    app.add_handler(filename_input_handler)
-    
-    # Add a generic message handler for unknown commands/typos (must be last)
-    async def handle_unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle unknown commands and suggest corrections"""
-        text = update.message.text.lower() if update.message.text else ""
-        
-        if text.startswith("/merge_wth") or text.startswith("/mergewth"):
-            await update.message.reply_text(
-                "❓ Did you mean `/merge_with`?\n\n"
-                "💡 **Usage:**\n"
-                "• Reply to a PDF and use `/merge_with 1,2,3`\n"
-                "• Or use `/merge` to see merge options"
-            )
-        elif text.startswith("/") and len(text) > 1:
-            await update.message.reply_text(
-                "❓ Unknown command. Use /help to see all available commands.\n\n"
-                "📋 **Quick commands:**\n"
-                "• /merge - Merge PDFs\n"
-                "• /split - Split PDF\n" 
-                "• /to_images - Convert to images\n"
-                "• /merge_with - Merge with replied PDF\n"
-                "• /list - Show files\n"
-                "• /help - Full help"
-            )
-    
-    app.add_handler(MessageHandler(filters.TEXT & filters.COMMAND, handle_unknown_command))
+    # Same handler set as webhook mode; imported here since bot_handlers imports this module
+    from bot.bot_handlers import setup_handlers
+    setup_handlers(app)
     
     # Add error handler for the application
     async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors in the bot"""
-        logger = logging.getLogger(__name__)
-        
         # Log the error
-        logger.error(f"Exception while handling an update: {context.error}")
+        log.error("Exception while handling an update: %s", context.error)
         
         # Handle specific types of errors
-        if "Conflict" in str(context.error):
-            logger.warning("Conflict error detected - another bot instance may be running")
+        if isinstance(context.error, Conflict):
+            log.warning("Conflict error detected - another bot instance may be running")
             # Don't send a message to user, just log it
             return
-        elif "timed out" in str(context.error).lower():
-            logger.warning("Timeout error - network issues")
+        elif isinstance(context.error, TimedOut):
+            log.warning("Timeout error - network issues")
             return
         
         # For other errors, try to inform the user if possible
@@ -1280,34 +1445,36 @@ def start_bot():
     
     app.add_error_handler(error_handler)
     
-    print("🚀 Page Craft Bot is starting...")
+    # Move the application, handlers and module globals out of GC scans
+    gc.freeze()
+    
+    log.info("🚀 Page Craft Bot is starting...")
     
     # Run with error handling to prevent conflicts
     try:
         app.run_polling(
             drop_pending_updates=True,  # Clear any pending updates
             allowed_updates=Update.ALL_TYPES,
-            poll_interval=2.0,  # Increase poll interval to reduce conflicts
-            timeout=20,  # Increase timeout
+            poll_interval=0.0,  # Long polling below already waits for updates
+            timeout=50,  # Seconds Telegram holds getUpdates open when idle
             bootstrap_retries=3  # Retry connection failures
         )
     except Exception as e:
-        print(f"❌ Bot startup failed: {e}")
-        if "Conflict" in str(e):
-            print("🔄 Another bot instance may be running. Retrying in 30 seconds...")
-            import time
+        log.error("❌ Bot startup failed: %s", e)
+        if isinstance(e, Conflict):
+            log.warning("🔄 Another bot instance may be running. Retrying in 30 seconds...")
             time.sleep(30)
             # Try again with even higher timeouts
             try:
                 app.run_polling(
                     drop_pending_updates=True,
                     allowed_updates=Update.ALL_TYPES,
-                    poll_interval=5.0,
-                    timeout=30,
+                    poll_interval=0.0,
+                    timeout=50,
                     bootstrap_retries=5
                 )
             except Exception as retry_error:
-                print(f"❌ Bot failed to start after retry: {retry_error}")
+                log.error("❌ Bot failed to start after retry: %s", retry_error)
                 raise retry_error
         else:
             raise e
@@ -3,7 +3,9 @@ Bot Handlers Setup Module
 Centralizes all bot command handlers for both webhook and polling modes
 """
 
-from telegram.ext import CommandHandler, MessageHandler, ConversationHandler, filters
+import logging
+
+from telegram.ext import CommandHandler, MessageHandler, filters
 
 # Import handlers from main bot module
 from bot.bot import (
@@ -18,11 +20,13 @@ from bot.bot import (
     merge_with_command, 
     convert_image_command, 
     combine_images_command,
-    handle_filename_input, 
     cancel_rename, 
-    WAITING_FOR_FILENAME
+    handle_text
 )
 
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Like bot.bot's log, stays visible under the ERROR root level
+
 def setup_handlers(application):
     """
     Setup all bot handlers for the application
@@ -30,36 +34,25 @@ def setup_handlers(application):
     Args:
         application: Telegram Application instance
     """
-    # Create conversation handler for filename input
-    command_filename_handler = ConversationHandler(
-        entry_points=[
-            CommandHandler("merge", merge_command),
-            CommandHandler("split", split_command),
-            CommandHandler("to_images", to_images_command),
-            CommandHandler("merge_with", merge_with_command),
-            CommandHandler("convert_image", convert_image_command),
-            CommandHandler("combine_images", combine_images_command),
-        ],
-        states={
-            WAITING_FOR_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_filename_input)]
-        },
-        fallbacks=[CommandHandler("cancel", cancel_rename)],
-        per_message=False
-    )
-
     # Add basic command handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("list", list_files_command))
     application.add_handler(CommandHandler("clear", clear_files_command))
     
-    # Add document handler (must be before conversation handler)
-    application.add_handler(MessageHandler(filters.Document.ALL, handle_any_document))
+    # Operations stash their result in context.user_data['pending'] until it is named
+    application.add_handler(CommandHandler("merge", merge_command))
+    application.add_handler(CommandHandler("split", split_command))
+    application.add_handler(CommandHandler("to_images", to_images_command))
+    application.add_handler(CommandHandler("merge_with", merge_with_command))
+    application.add_handler(CommandHandler("convert_image", convert_image_command))
+    application.add_handler(CommandHandler("combine_images", combine_images_command))
+    application.add_handler(CommandHandler("cancel", cancel_rename))
     
-    # Add conversation handler
-    application.add_handler(command_filename_handler)
+    # Add document handler
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_any_document))
     
-    # Add global filename input handler
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_filename_input))
+    # Everything else that is text: filenames and unknown commands/typos (must be last)
+    application.add_handler(MessageHandler(filters.TEXT, handle_text))
     
-    print("✅ All bot handlers registered successfully")
+    logger.info("✅ All bot handlers registered successfully")
@@ -1,16 +1,11 @@
 # Page Craft Bot - Webhook Mode (Prevents Sleeping on Render)
+# Run from the repository root: python -m bot.bot_webhook
 import os
 import logging
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.ext import ApplicationBuilder
 
-# Import all handlers from bot.py
-from bot import (
-    start, help_command, list_files_command, clear_files_command,
-    handle_any_document, merge_command, split_command, to_images_command,
-    merge_with_command, convert_image_command, combine_images_command,
-    handle_filename_input, cancel_rename, WAITING_FOR_FILENAME
-)
+# Same handler registration as polling mode and main.py
+from bot.bot_handlers import setup_handlers
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -19,6 +14,7 @@ def start_webhook_bot():
     """Start the bot in webhook mode for Render deployment"""
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     RENDER_EXTERNAL_URL = os.getenv('RENDER_EXTERNAL_URL')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
     PORT = int(os.getenv('PORT', 10000))
     
     if not BOT_TOKEN:
@@ -30,37 +26,15 @@ def start_webhook_bot():
         return
     
     # Build application
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
-    
-    # Create conversation handler
-    command_filename_handler = ConversationHandler(
-        entry_points=[
-            CommandHandler("merge", merge_command),
-            CommandHandler("split", split_command),
-            CommandHandler("to_images", to_images_command),
-            CommandHandler("merge_with", merge_with_command),
-            CommandHandler("convert_image", convert_image_command),
-            CommandHandler("combine_images", combine_images_command),
-        ],
-        states={
-            WAITING_FOR_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_filename_input)]
-        },
-        fallbacks=[CommandHandler("cancel", cancel_rename)],
-        per_message=False
-    )
+    # No jobs are scheduled in webhook mode, so skip the JobQueue
+    app = ApplicationBuilder().token(BOT_TOKEN).job_queue(None).build()
     
     # Add all handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("list", list_files_command))
-    app.add_handler(CommandHandler("clear", clear_files_command))
-    app.add_handler(MessageHandler(filters.Document.ALL, handle_any_document))
-    app.add_handler(command_filename_handler)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_filename_input))
+    setup_handlers(app)
     
     logger.info("🚀 Starting webhook mode...")
-    logger.info(f"📍 Webhook URL: {RENDER_EXTERNAL_URL}/webhook")
-    logger.info(f"🔌 Port: {PORT}")
+    logger.info("📍 Webhook URL: %s/webhook", RENDER_EXTERNAL_URL)
+    logger.info("🔌 Port: %s", PORT)
     
     # Run webhook
     app.run_webhook(
@@ -68,7 +42,8 @@ def start_webhook_bot():
         port=PORT,
         url_path="webhook",
         webhook_url=f"{RENDER_EXTERNAL_URL}/webhook",
-        drop_pending_updates=True
+        secret_token=WEBHOOK_SECRET,  # PTB rejects requests without the matching header
+        drop_pending_updates=False  # Keep updates that arrived while a redeploy was in progress
     )
 
 if __name__ == "__main__":
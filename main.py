@@ -7,14 +7,17 @@ A powerful Telegram bot for document processing with webhook support
 import os
 import sys
 import logging
-import threading
-import time
-import queue
+import gc
+import hmac
 import asyncio
-from flask import Flask, request, jsonify
+import contextlib
+import json
+import aiohttp
+from aiohttp import web
 from telegram import Update
 from telegram.ext import Application
 from bot.bot_handlers import setup_handlers
+from bot.bot import PageCraftApplication, close_wake_session, warm_pdf_backend
 
 # Configure logging
 logging.basicConfig(
@@ -24,217 +27,236 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Flask app
-app = Flask(__name__)
+# orjson decodes incoming updates faster, straight from the body bytes; the stdlib parser is the fallback
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
-# Thread-safe update queue
-update_queue = queue.Queue()
-_bot_thread = None
-_initialized = False
+# Web app; shares its event loop with the Telegram application
+app = web.Application()
 
 # Environment variables
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # e.g., https://page-craft-bot.onrender.com
 WEBHOOK_PORT = int(os.getenv("PORT", "10000"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Optional; sent by Telegram as X-Telegram-Bot-Api-Secret-Token
+# compare_digest only accepts ASCII str, so the secret is compared as bytes
+_WEBHOOK_SECRET_BYTES = WEBHOOK_SECRET.encode('utf-8') if WEBHOOK_SECRET else None
+
+# Bot API endpoints used by the admin routes
+_TG_BASE = f"https://api.telegram.org/bot{BOT_TOKEN}"
+_SET_WEBHOOK_URL = f"{_TG_BASE}/setWebhook"
+_GET_WEBHOOK_INFO_URL = f"{_TG_BASE}/getWebhookInfo"
 
 # Global application instance
 telegram_app = None
 
-def ensure_bot_initialized():
-    """Ensure the bot is initialized before processing requests"""
-    global telegram_app, _initialized, _bot_thread
-    if not _initialized:
-        try:
-            setup_telegram_app()
-            _bot_thread = threading.Thread(target=run_bot_thread, daemon=True)
-            _bot_thread.start()
-            _initialized = True
-            logger.info("Bot initialization completed successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize bot: {e}")
-            raise
+# HTTP client for Bot API and wake-up requests, pooled for the life of the server
+client_session = None
+_wake_task = None
+
+# Home page body; WEBHOOK_URL is fixed for the life of the process
+_HOME_BODY = json.dumps({
+    'status': 'running',
+    'bot_name': 'Page Craft Bot',
+    'mode': 'webhook',
+    'webhook_url': f"{WEBHOOK_URL}/webhook" if WEBHOOK_URL else None,
+    'endpoints': {
+        'webhook': '/webhook',
+        'set_webhook': '/set_webhook',
+        'delete_webhook': '/delete_webhook',
+        'webhook_info': '/webhook_info',
+        'health': '/health'
+    }
+}).encode('utf-8')
+# /health is hit every few minutes by monitors and its body never changes
+_HEALTH_BODY = json.dumps({
+    'status': 'healthy',
+    'mode': 'webhook',
+    'webhook_url': f"{WEBHOOK_URL}/webhook" if WEBHOOK_URL else None
+}).encode('utf-8')
+# Acknowledgement returned for every webhook update
+_WEBHOOK_OK_BODY = b'{"status": "ok"}'
 
 def setup_telegram_app():
     """Initialize the Telegram application with handlers"""
     global telegram_app
     
-    telegram_app = Application.builder().token(BOT_TOKEN).build()
+    # Updates are handed to PTB's own queue; per-user ordering is kept by PageCraftApplication
+    telegram_app = (
+        Application.builder()
+        .application_class(PageCraftApplication)
+        .concurrent_updates(True)
+        .job_queue(None)  # Only polling mode schedules jobs (auto-wake); don't run an idle scheduler here
+        .token(BOT_TOKEN)
+        .build()
+    )
     
     # Setup all handlers from bot module
     setup_handlers(telegram_app)
     
+    # Move the application and handlers out of GC scans
+    gc.freeze()
+    
     logger.info("Telegram application initialized with all handlers")
 
-def run_bot_thread():
-    """Run the bot in a separate thread with its own event loop"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+async def on_startup(web_app):
+    """Start the Telegram application and auto-wake on the web server's event loop"""
+    global client_session, _wake_task
+    client_session = aiohttp.ClientSession()
+    await telegram_app.initialize()
+    await telegram_app.start()
+    logger.info("Bot initialization completed successfully")
     
-    async def process_updates():
-        await telegram_app.initialize()
-        while True:
-            try:
-                # Get update from queue with timeout
-                update = update_queue.get(timeout=1)
-                await telegram_app.process_update(update)
-                update_queue.task_done()
-            except queue.Empty:
-                continue
-            except Exception as e:
-                logger.error(f"Error processing update in bot thread: {e}")
+    _wake_task = asyncio.create_task(auto_wake())
+    logger.info("Auto-wake system started")
     
-    try:
-        loop.run_until_complete(process_updates())
-    except Exception as e:
-        logger.error(f"Bot thread error: {e}")
-    finally:
-        loop.close()
+    # Load pypdf while waiting for the first update instead of during it
+    telegram_app.create_task(asyncio.to_thread(warm_pdf_backend))
+
+async def on_cleanup(web_app):
+    """Stop the Telegram application when the web server shuts down"""
+    if _wake_task is not None:
+        _wake_task.cancel()
+        # Let an in-flight wake request unwind before its session is closed
+        with contextlib.suppress(asyncio.CancelledError):
+            await _wake_task
+    await telegram_app.stop()
+    await telegram_app.shutdown()
+    await client_session.close()
+    # Activity pings open bot.bot's keep-alive session on the first update
+    await close_wake_session()
 
-# Flask routes
-@app.route('/', methods=['GET'])
-def home():
+# Web routes
+async def home(request):
     """Home page with bot information"""
-    return jsonify({
-        'status': 'running',
-        'bot_name': 'Page Craft Bot',
-        'mode': 'webhook',
-        'webhook_url': f"{WEBHOOK_URL}/webhook" if WEBHOOK_URL else None,
-        'endpoints': {
-            'webhook': '/webhook',
-            'set_webhook': '/set_webhook',
-            'delete_webhook': '/delete_webhook',
-            'webhook_info': '/webhook_info',
-            'health': '/health'
-        }
-    }), 200
+    return web.Response(body=_HOME_BODY, content_type='application/json')
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
+async def webhook(request):
     """Handle incoming webhook updates from Telegram"""
-    if request.method == 'POST':
-        try:
-            # Ensure bot is initialized
-            ensure_bot_initialized()
-            
-            # Parse the incoming update
-            update = Update.de_json(request.get_json(), telegram_app.bot)
-            
-            # Log the update details
-            if update.message:
-                message_type = "text" if update.message.text else "document" if update.message.document else "other"
-                content = update.message.text[:50] if update.message.text else "N/A"
-                logger.info(f"Received update: {update.update_id} - Type: {message_type} - Content: {content}")
-            else:
-                logger.info(f"Received update: {update.update_id} - Type: Unknown")
-            
-            # Add update to queue for processing by bot thread
-            update_queue.put(update)
-            logger.info(f"Successfully queued update: {update.update_id}")
-            return jsonify({'status': 'ok'}), 200
-                
-        except Exception as e:
-            logger.error(f"Error processing webhook: {e}")
-            logger.error(f"Update data: {request.get_json()}")
-            return jsonify({'error': str(e)}), 500
+    # Reject requests that don't carry the secret Telegram was given in /set_webhook
+    if _WEBHOOK_SECRET_BYTES and not hmac.compare_digest(
+        request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode('utf-8', 'surrogateescape'),
+        _WEBHOOK_SECRET_BYTES
+    ):
+        return web.json_response({'error': 'Forbidden'}, status=403)
     
-    return jsonify({'error': 'Method not allowed'}), 405
+    try:
+        # Parse the incoming update
+        update = Update.de_json(_json_loads(await request.read()), telegram_app.bot)
+        
+        # Log the update details
+        if update.message:
+            message_type = "text" if update.message.text else "document" if update.message.document else "other"
+            content = update.message.text[:50] if update.message.text else "N/A"
+            logger.info("Received update: %s - Type: %s - Content: %s", update.update_id, message_type, content)
+        else:
+            logger.info("Received update: %s - Type: Unknown", update.update_id)
+        
+        # Hand the update to the application; Telegram gets its answer without waiting for processing
+        await telegram_app.update_queue.put(update)
+        logger.info("Successfully queued update: %s", update.update_id)
+        return web.Response(body=_WEBHOOK_OK_BODY, content_type='application/json')
+            
+    except Exception as e:
+        logger.error("Error processing webhook: %s", e)
+        logger.error("Update data: %s", await request.text())
+        return web.json_response({'error': str(e)}, status=500)
 
-@app.route('/set_webhook', methods=['GET', 'POST'])
-def set_webhook():
+async def set_webhook(request):
     """Set the webhook URL with Telegram"""
     try:
         if not WEBHOOK_URL:
-            return jsonify({'error': 'WEBHOOK_URL environment variable not set'}), 400
+            return web.json_response({'error': 'WEBHOOK_URL environment variable not set'}, status=400)
         
         webhook_url = f"{WEBHOOK_URL}/webhook"
         
-        # Use requests to set webhook
-        import requests
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook"
-        response = requests.post(url, json={'url': webhook_url})
+        payload = {'url': webhook_url}
+        if WEBHOOK_SECRET:
+            payload['secret_token'] = WEBHOOK_SECRET
+        async with client_session.post(_SET_WEBHOOK_URL, json=payload) as response:
+            if not response.ok:
+                # Telegram's error body is only read when there is one to report
+                return web.json_response({'error': 'Failed to set webhook', 'details': await response.text()}, status=500)
         
-        if response.status_code == 200:
-            logger.info(f"Webhook set successfully to {webhook_url}")
-            return jsonify({
-                'status': 'success',
-                'message': f'Webhook set to {webhook_url}',
-                'webhook_url': webhook_url
-            }), 200
-        else:
-            return jsonify({'error': 'Failed to set webhook', 'details': response.text}), 500
+        logger.info("Webhook set successfully to %s", webhook_url)
+        return web.json_response({
+            'status': 'success',
+            'message': f'Webhook set to {webhook_url}',
+            'webhook_url': webhook_url
+        })
             
     except Exception as e:
-        logger.error(f"Error setting webhook: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error setting webhook: %s", e)
+        return web.json_response({'error': str(e)}, status=500)
 
-@app.route('/delete_webhook', methods=['GET', 'POST'])
-def delete_webhook():
+async def delete_webhook(request):
     """Remove the webhook from Telegram"""
     try:
-        # Ensure bot is initialized
-        ensure_bot_initialized()
-        
-        result = asyncio.run(telegram_app.bot.delete_webhook())
+        result = await telegram_app.bot.delete_webhook()
         
         if result:
             logger.info("Webhook deleted successfully")
-            return jsonify({
+            return web.json_response({
                 'status': 'success',
                 'message': 'Webhook deleted successfully'
-            }), 200
+            })
         else:
-            return jsonify({'error': 'Failed to delete webhook'}), 500
+            return web.json_response({'error': 'Failed to delete webhook'}, status=500)
             
     except Exception as e:
-        logger.error(f"Error deleting webhook: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error deleting webhook: %s", e)
+        return web.json_response({'error': str(e)}, status=500)
 
-@app.route('/webhook_info', methods=['GET'])
-def webhook_info():
+async def webhook_info(request):
     """Get current webhook information from Telegram"""
     try:
-        # Use requests to get webhook info
-        import requests
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getWebhookInfo"
-        response = requests.get(url)
+        async with client_session.get(_GET_WEBHOOK_INFO_URL) as response:
+            if not response.ok:
+                return web.json_response({'error': 'Failed to get webhook info'}, status=500)
+            data = await response.json()
         
-        if response.status_code == 200:
-            data = response.json()
-            return jsonify({
-                'status': 'success',
-                'webhook_info': data['result']
-            }), 200
-        else:
-            return jsonify({'error': 'Failed to get webhook info'}), 500
+        return web.json_response({
+            'status': 'success',
+            'webhook_info': data['result']
+        })
 
     except Exception as e:
-        logger.error(f"Error getting webhook info: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error getting webhook info: %s", e)
+        return web.json_response({'error': str(e)}, status=500)
 
-@app.route('/health', methods=['GET'])
-def health_check():
+async def health_check(request):
     """Health check endpoint for monitoring services"""
-    return jsonify({
-        'status': 'healthy',
-        'mode': 'webhook',
-        'webhook_url': f"{WEBHOOK_URL}/webhook" if WEBHOOK_URL else None
-    }), 200
+    return web.Response(body=_HEALTH_BODY, content_type='application/json')
+
+app.router.add_get('/', home)
+app.router.add_post('/webhook', webhook)
+app.router.add_get('/set_webhook', set_webhook)
+app.router.add_post('/set_webhook', set_webhook)
+app.router.add_get('/delete_webhook', delete_webhook)
+app.router.add_post('/delete_webhook', delete_webhook)
+app.router.add_get('/webhook_info', webhook_info)
+app.router.add_get('/health', health_check)
 
 
-def auto_wake():
+async def auto_wake():
     """Auto-wake function to prevent Render free tier from sleeping"""
     while True:
         try:
-            time.sleep(840)  # 14 minutes
+            await asyncio.sleep(840)  # 14 minutes
             if WEBHOOK_URL:
-                import requests
-                requests.get(f"{WEBHOOK_URL}/health", timeout=10)
+                async with client_session.get(f"{WEBHOOK_URL}/health", timeout=aiohttp.ClientTimeout(total=10)):
+                    pass
                 logger.info("Auto-wake ping sent")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Auto-wake error: {e}")
+            logger.error("Auto-wake error: %s", e)
 
 def create_app():
-    """Create and configure the Flask application"""
+    """Create and configure the aiohttp application"""
     # Validate environment variables
     if not BOT_TOKEN:
         logger.error("BOT_TOKEN environment variable not set")
@@ -243,16 +265,13 @@ def create_app():
     if not WEBHOOK_URL:
         logger.warning("WEBHOOK_URL environment variable not set - webhook mode may not work properly")
     
-    # Setup Telegram application
+    # Setup Telegram application; it and the auto-wake task are started and stopped with the web server
     setup_telegram_app()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
     
-    # Start auto-wake system
-    wake_thread = threading.Thread(target=auto_wake, daemon=True)
-    wake_thread.start()
-    logger.info("Auto-wake system started")
-    
-    logger.info(f"Telegram application initialized successfully")
-    logger.info(f"Webhook URL will be: {WEBHOOK_URL}/webhook")
+    logger.info("Telegram application initialized successfully")
+    logger.info("Webhook URL will be: %s/webhook", WEBHOOK_URL)
     
     return app
 
@@ -260,14 +279,18 @@ if __name__ == '__main__':
     # Create and configure the app
     app = create_app()
     
-    logger.info(f"🚀 Starting Page Craft Bot in WEBHOOK mode on port {WEBHOOK_PORT}")
-    logger.info(f"🌐 Webhook URL: {WEBHOOK_URL}/webhook")
-    logger.info(f"💡 After deployment, visit {WEBHOOK_URL}/set_webhook to activate webhook")
+    logger.info("🚀 Starting Page Craft Bot in WEBHOOK mode on port %s", WEBHOOK_PORT)
+    logger.info("🌐 Webhook URL: %s/webhook", WEBHOOK_URL)
+    logger.info("💡 After deployment, visit %s/set_webhook to activate webhook", WEBHOOK_URL)
+    
+    # uvloop is a faster drop-in event loop where available; asyncio's own loop works too
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())  # uvloop.install() is deprecated on 3.12
+        logger.info("⚡ Using uvloop event loop")
+    except ImportError:
+        pass
     
-    # Run Flask app
+    # Run the web server (and with it the bot) on a single event loop
     port = int(os.environ.get('PORT', WEBHOOK_PORT))
-    app.run(
-        host='0.0.0.0',
-        port=port,
-        debug=False
-    )
+    web.run_app(app, host='0.0.0.0', port=port)
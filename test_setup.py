@@ -47,10 +47,10 @@ for file_path in required_files:
 # Check 3: Dependencies
 print("\n3️⃣ Checking Dependencies...")
 try:
-    import flask
-    success.append("✅ Flask is installed")
+    import aiohttp
+    success.append("✅ aiohttp is installed")
 except ImportError:
-    errors.append("❌ Flask is not installed. Run: pip install Flask")
+    errors.append("❌ aiohttp is not installed. Run: pip install aiohttp")
 
 try:
     import telegram
@@ -58,12 +58,6 @@ try:
 except ImportError:
     errors.append("❌ python-telegram-bot is not installed")
 
-try:
-    import requests
-    success.append("✅ requests is installed")
-except ImportError:
-    errors.append("❌ requests is not installed")
-
 # Check 4: Imports
 print("\n4️⃣ Checking Main Application Import...")
 try:
@@ -81,7 +75,7 @@ try:
         else:
             errors.append("❌ Auto-wake system missing in main.py")
             
-        if "@app.route('/webhook'" in content:
+        if "app.router.add_post('/webhook'" in content:
             success.append("✅ Webhook endpoint present")
         else:
             errors.append("❌ Webhook endpoint missing in main.py")
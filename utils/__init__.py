@@ -1,4 +1,4 @@
 # PDF utilities package
-from .pdf_utils import merge_pdfs, split_pdf, pdf_to_images, create_zip_from_images, image_to_pdf, images_to_pdf
+from .pdf_utils import merge_pdfs, split_pdf, pdf_to_images, pdf_to_images_zip, create_zip_from_images, image_to_pdf, images_to_pdf
 
-__all__ = ['merge_pdfs', 'split_pdf', 'pdf_to_images', 'create_zip_from_images', 'image_to_pdf', 'images_to_pdf']
+__all__ = ['merge_pdfs', 'split_pdf', 'pdf_to_images', 'pdf_to_images_zip', 'create_zip_from_images', 'image_to_pdf', 'images_to_pdf']
@@ -1,10 +1,55 @@
 # PDF utility functions for merging, splitting, and converting PDFs
 import os
+import re
+import mmap
+import shutil
 import zipfile
-from pypdf import PdfReader, PdfWriter
 import tempfile
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
-# Note: pdf2image and PIL imports moved to functions for memory optimization
+# Note: pypdf, pdf2image and PIL imports moved to functions for memory optimization
+
+# Page ranges accepted by split_pdf: "3" or "5-8"
+_PAGE_RANGE = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d+))?\s*$')
+
+# pypdf emits many small writes; a large buffer turns them into a few big ones
+WRITE_BUFFER_SIZE = 1 << 20
+
+def _workers_from_env():
+    """PAGECRAFT_WORKERS as a positive int; 1 when unset or invalid"""
+    try:
+        return max(1, int(os.getenv("PAGECRAFT_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+# Parallel workers for image decoding and page rendering. Each pdftoppm worker parses the
+# whole document and the free tier gets a fraction of one CPU, so one unless PAGECRAFT_WORKERS says otherwise
+WORKERS = _workers_from_env()
+
+# pdftoppm encodes rendered pages itself, so pages never pass through PIL
+RENDER_DPI = 150
+JPEG_OPTIONS = {'quality': 85, 'optimize': True}
+
+def _render_pages(pdf_path, output_dir, workers=None):
+    """Render every page to a JPEG file in output_dir; returns the paths in page order"""
+    from pdf2image import convert_from_path
+    
+    return convert_from_path(
+        pdf_path,
+        dpi=RENDER_DPI,
+        fmt='jpeg',
+        jpegopt=JPEG_OPTIONS,
+        thread_count=workers or WORKERS,  # pdf2image splits pages across pdftoppm processes
+        output_folder=output_dir,
+        paths_only=True,
+        poppler_path=None
+    )
+
+def _map_pdf(pdf_file, stack):
+    """Map a PDF read-only so pypdf reads it through the page cache instead of a full in-memory copy"""
+    fh = stack.enter_context(open(pdf_file, 'rb'))
+    return stack.enter_context(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
 
 def merge_pdfs(pdf_files, output_path="merged.pdf"):
     """
@@ -23,20 +68,33 @@ def merge_pdfs(pdf_files, output_path="merged.pdf"):
     if len(pdf_files) == 1:
         raise ValueError("At least two PDF files are required for merging")
     
+    from pypdf import PdfReader, PdfWriter
     writer = PdfWriter()
     
-    for pdf_file in pdf_files:
-        if not os.path.exists(pdf_file):
-            raise FileNotFoundError(f"PDF file not found: {pdf_file}")
-        
-        try:
-            reader = PdfReader(pdf_file)
-            for page in reader.pages:
-                writer.add_page(page)
-        except Exception as e:
-            raise Exception(f"Error reading PDF file {pdf_file}: {e}")
+    # A file listed more than once (e.g. /merge 1,2,1) is only parsed once;
+    # other readers are dropped as soon as their pages are copied
+    repeated = {pdf_file for pdf_file in pdf_files if pdf_files.count(pdf_file) > 1}
+    readers = {}
+    with ExitStack() as repeated_maps:
+        for pdf_file in pdf_files:
+            if not os.path.exists(pdf_file):
+                raise FileNotFoundError(f"PDF file not found: {pdf_file}")
+            
+            try:
+                # Pages are cloned into the writer, so a single-use map can be closed right away
+                with ExitStack() as own_map:
+                    reader = readers.get(pdf_file)
+                    if reader is None:
+                        maps = repeated_maps if pdf_file in repeated else own_map
+                        reader = PdfReader(_map_pdf(pdf_file, maps))
+                        if pdf_file in repeated:
+                            readers[pdf_file] = reader
+                    for page in reader.pages:
+                        writer.add_page(page)
+            except Exception as e:
+                raise Exception(f"Error reading PDF file {pdf_file}: {e}")
     
-    with open(output_path, 'wb') as output_file:
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as output_file:
         writer.write(output_file)
     
     return output_path
@@ -56,27 +114,27 @@ def split_pdf(pdf_file, page_range, output_path="split.pdf"):
     if not os.path.exists(pdf_file):
         raise FileNotFoundError(f"PDF file not found: {pdf_file}")
     
+    from pypdf import PdfReader, PdfWriter
     try:
+        # Parse page range before loading the PDF
+        match = _PAGE_RANGE.match(page_range)
+        if not match:
+            raise ValueError(f"Invalid page range '{page_range}'. Use a page like 3 or a range like 5-8.")
+        start_page = int(match.group(1)) - 1  # Convert to 0-based index
+        end_page = int(match.group(2) or match.group(1)) - 1
+        
         reader = PdfReader(pdf_file)
         total_pages = len(reader.pages)
         
-        # Parse page range
-        if '-' in page_range:
-            start_page, end_page = page_range.split('-')
-            start_page = int(start_page) - 1  # Convert to 0-based index
-            end_page = int(end_page) - 1      # Convert to 0-based index
-        else:
-            start_page = end_page = int(page_range) - 1  # Single page
-        
         # Validate page range
         if start_page < 0 or end_page >= total_pages or start_page > end_page:
             raise ValueError(f"Invalid page range. PDF has {total_pages} pages.")
         
         writer = PdfWriter()
-        for page_num in range(start_page, end_page + 1):
-            writer.add_page(reader.pages[page_num])
+        for page in reader.pages[start_page:end_page + 1]:
+            writer.add_page(page)
         
-        with open(output_path, 'wb') as output_file:
+        with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as output_file:
             writer.write(output_file)
         
         return output_path
@@ -84,40 +142,30 @@ def split_pdf(pdf_file, page_range, output_path="split.pdf"):
     except Exception as e:
         raise Exception(f"Error splitting PDF: {e}")
 
-def pdf_to_images(pdf_path, output_dir=None):
+def pdf_to_images(pdf_path, output_dir=None, workers=None):
     """
     Convert PDF pages to images with memory optimization for free tier.
     
     Args:
         pdf_path: Path to the input PDF file
         output_dir: Directory to save images
+        workers: pdftoppm processes to render page ranges in parallel
     
     Returns:
         list: List of image file paths
     """
     try:
-        from pdf2image import convert_from_path
-        
         if output_dir is None:
             output_dir = tempfile.mkdtemp()
         
         # Ensure output directory exists
         os.makedirs(output_dir, exist_ok=True)
         
-        # Convert PDF to images without output_folder parameter
-        images = convert_from_path(
-            pdf_path,
-            dpi=150,
-            fmt='JPEG',
-            thread_count=1,
-            poppler_path=None
-        )
-        
-        # Save images manually
+        # Poppler writes the JPEGs; give them the usual page_N names
         image_paths = []
-        for i, image in enumerate(images):
+        for i, rendered_path in enumerate(_render_pages(pdf_path, output_dir, workers)):
             image_path = os.path.join(output_dir, f"page_{i+1}.jpg")
-            image.save(image_path, "JPEG", quality=85, optimize=True)
+            os.replace(rendered_path, image_path)
             image_paths.append(image_path)
         
         return image_paths
@@ -127,6 +175,14 @@ def pdf_to_images(pdf_path, output_dir=None):
     except Exception as e:
         raise RuntimeError(f"Error converting PDF to images: {e}")
 
+def _store_file(zipf, file_path, arcname):
+    """Add a file to a ZIP_STORED archive, copying it in WRITE_BUFFER_SIZE chunks"""
+    # ZipFile.write copies in 8 KB chunks; already-compressed images only need a plain copy
+    info = zipfile.ZipInfo.from_file(file_path, arcname)
+    info.compress_type = zipfile.ZIP_STORED
+    with open(file_path, 'rb') as src, zipf.open(info, 'w') as dest:
+        shutil.copyfileobj(src, dest, WRITE_BUFFER_SIZE)
+
 def create_zip_from_images(image_paths, zip_path="images.zip"):
     """
     Create a ZIP file containing all images.
@@ -138,14 +194,149 @@ def create_zip_from_images(image_paths, zip_path="images.zip"):
     Returns:
         str: Path to the ZIP file
     """
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
+    # Images are already compressed, so store them without deflating again
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
         for image_path in image_paths:
-            zipf.write(image_path, os.path.basename(image_path))
+            _store_file(zipf, image_path, os.path.basename(image_path))
     
     return zip_path
 
+def pdf_to_images_zip(pdf_path, zip_path="images.zip", workers=None):
+    """
+    Render PDF pages straight into a ZIP of JPEGs encoded by Poppler.
+    
+    Args:
+        pdf_path: Path to the input PDF file
+        zip_path: Output ZIP file path
+        workers: pdftoppm processes to render page ranges in parallel
+    
+    Returns:
+        tuple: (zip_path, number of pages written)
+    """
+    try:
+        # Render next to the ZIP so the pages stay on the same filesystem
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(zip_path) or None) as render_dir:
+            image_paths = _render_pages(pdf_path, render_dir, workers)
+            
+            # JPEGs are already compressed, so store them without deflating again
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+                for i, image_path in enumerate(image_paths):
+                    _store_file(zipf, image_path, f"page_{i+1}.jpg")
+        
+        return zip_path, len(image_paths)
+        
+    except ImportError:
+        raise RuntimeError("PDF to images conversion requires pdf2image package")
+    except Exception as e:
+        raise RuntimeError(f"Error converting PDF to images: {e}")
+
+# JPEG start-of-frame markers (baseline, extended, progressive, lossless...)
+_JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+# Of those, only Huffman-coded baseline, extended and progressive frames are DCTDecode-safe
+_JPEG_DCT_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2))
+_JPEG_COLORSPACES = {1: b"/DeviceGray", 3: b"/DeviceRGB"}
+
+def _jpeg_info(f):
+    """Return (width, height, components) from a JPEG file's frame header, or None
+    
+    Walks the marker segments from the file's current position, skipping segment
+    bodies, so only the header is read rather than the whole image.
+    """
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        header = f.read(2)
+        if len(header) < 2 or header[0] != 0xFF:
+            return None
+        marker = header[1]
+        while marker == 0xFF:  # Fill bytes
+            fill = f.read(1)
+            if not fill:
+                return None
+            marker = fill[0]
+        if marker == 0xD9:  # End of image before any frame
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+            continue
+        segment = f.read(2)
+        if len(segment) < 2:
+            return None
+        length = int.from_bytes(segment, "big")
+        if marker in _JPEG_SOF_MARKERS:
+            frame = f.read(6)
+            # Lossless, hierarchical and arithmetic-coded frames, and anything but 8-bit samples, need Pillow
+            if len(frame) < 6 or marker not in _JPEG_DCT_SOF_MARKERS or frame[0] != 8:
+                return None
+            height = int.from_bytes(frame[1:3], "big")
+            width = int.from_bytes(frame[3:5], "big")
+            return width, height, frame[5]
+        if length < 2:
+            return None
+        f.seek(length - 2, os.SEEK_CUR)
+
+def _jpeg_page(image_path):
+    """Return (width, height, colorspace) if the file is a JPEG a PDF can embed as-is, else None"""
+    with open(image_path, 'rb') as f:
+        info = _jpeg_info(f)
+    if info is None or info[2] not in _JPEG_COLORSPACES:
+        return None
+    width, height, components = info
+    return width, height, _JPEG_COLORSPACES[components]
+
+def _jpeg_to_pdf(pages, output_path):
+    """Wrap JPEG files in a PDF, one page each, using /DCTDecode without re-encoding
+    
+    Args:
+        pages: (image_path, width, height, colorspace) tuples, in page order
+        output_path: Output file path for the PDF
+    """
+    # Objects 1 and 2 are the catalog and page tree; each page then takes three
+    kids = b" ".join(b"%d 0 R" % (3 + 3 * i) for i in range(len(pages)))
+    offsets = []
+    
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        position = f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        
+        def write_object(body):
+            nonlocal position
+            offsets.append(position)
+            position += f.write(b"%d 0 obj\n%s\nendobj\n" % (len(offsets), body))
+        
+        write_object(b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(pages)))
+        for image_path, width, height, colorspace in pages:
+            page = len(offsets) + 1
+            content = b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (width, height)
+            write_object(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                % (width, height, page + 1, page + 2)
+            )
+            # Copy the image stream in chunks rather than holding a whole JPEG in memory
+            with open(image_path, 'rb') as image_file:
+                length = os.fstat(image_file.fileno()).st_size
+                offsets.append(position)
+                position += f.write(
+                    b"%d 0 obj\n<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                    b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n"
+                    % (len(offsets), width, height, colorspace, length)
+                )
+                shutil.copyfileobj(image_file, f, WRITE_BUFFER_SIZE)
+                position += length + f.write(b"\nendstream\nendobj\n")
+            write_object(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, position))
+
 def image_to_pdf(image_path, output_path):
     """Convert a single image to PDF"""
+    # JPEG data can be embedded as-is: PDF decodes DCT natively
+    page = _jpeg_page(image_path)
+    if page is not None:
+        _jpeg_to_pdf([(image_path, *page)], output_path)
+        return
+    
     try:
         from PIL import Image
         
@@ -183,22 +374,48 @@ def image_to_pdf(image_path, output_path):
         c.drawImage(image_path, x, y, width=scaled_width, height=scaled_height)
         c.save()
 
-def images_to_pdf(image_paths, output_path):
+def _load_rgb_image(image_path):
+    """Open and fully decode an image as RGB (PIL releases the GIL while decoding)"""
+    from PIL import Image
+    
+    image = Image.open(image_path)
+    image.load()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+def images_to_pdf_from_objs(images, output_path):
+    """Write already-decoded PIL images to a single PDF, one page each"""
+    if images:
+        images[0].save(output_path, "PDF", save_all=True, append_images=images[1:])
+
+def images_to_pdf(image_paths, output_path, workers=None):
     """Convert multiple images to a single PDF"""
+    # When every image is an embeddable JPEG, no pixels need decoding at all
+    jpeg_pages = []
+    for image_path in image_paths:
+        page = _jpeg_page(image_path)
+        if page is None:
+            break
+        jpeg_pages.append((image_path, *page))
+    else:
+        if jpeg_pages:
+            _jpeg_to_pdf(jpeg_pages, output_path)
+            return
+    
     try:
-        from PIL import Image
+        import PIL.Image  # Falls back to reportlab below if Pillow is missing
         
-        # Convert first image and prepare for PDF
-        images = []
-        for image_path in image_paths:
-            image = Image.open(image_path)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            images.append(image)
+        # Decode all images in parallel, keeping upload order
+        workers = min(workers or WORKERS, len(image_paths)) or 1
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                images = list(pool.map(_load_rgb_image, image_paths))
+        else:
+            images = [_load_rgb_image(image_path) for image_path in image_paths]
         
         # Save all images as PDF pages
-        if images:
-            images[0].save(output_path, "PDF", save_all=True, append_images=images[1:])
+        images_to_pdf_from_objs(images, output_path)
             
     except ImportError:
         # Fallback using reportlab